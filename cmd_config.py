@@ -1,28 +1,45 @@
 # config_center.py
 
+import os
 import sys
+from functools import lru_cache
 from typing import Optional
 
-# 1. 声明全局变量，用于存储当前账户名
-CURRENT_ACCOUNT: Optional[str] = None
+# 1. 声明全局变量，用于存储当前账户名（首次调用 get_current_account() 时才解析）
+_current_account: Optional[str] = None
 
-def initialize_runtime_config():
+def initialize_runtime_config() -> str:
     """
-    解析命令行参数，设置 CURRENT_ACCOUNT。
+    解析命令行参数，设置当前账户名。
     """
-    global CURRENT_ACCOUNT
+    global _current_account
     
     # 检查命令行参数是否有传入账户名
     if len(sys.argv) > 1:
         # sys.argv[1] 就是启动脚本时传入的第一个参数 (例如 'okxMain')
-        CURRENT_ACCOUNT = sys.argv[1]
+        _current_account = sys.argv[1]
     else:
-        CURRENT_ACCOUNT = "default"
+        _current_account = "default"
         
-    print(f"Configuration Center initialized. Current Account: {CURRENT_ACCOUNT}")
+    # 只有设置了 FAT_VERBOSE_CONFIG 环境变量时才输出（本模块不能导入 trade_logger，否则循环导入）
+    if os.environ.get('FAT_VERBOSE_CONFIG'):
+        print(f"Configuration Center initialized. Current Account: {_current_account}")
+    return _current_account
 
-# 2. 关键：在模块被导入时立即执行初始化
-# 这样任何导入此模块的脚本，在执行后续代码前，CURRENT_ACCOUNT 都会被设置好。
-initialize_runtime_config()
+@lru_cache(maxsize=None)
+def get_current_account() -> str:
+    """
+    获取当前账户名。第一次调用时解析命令行参数，之后直接返回缓存结果。
+    """
+    if _current_account is None:
+        return initialize_runtime_config()
+    return _current_account
+
+# 2. 兼容旧的 `from cmd_config import CURRENT_ACCOUNT` 写法：
+# 导入时不再执行初始化，访问 CURRENT_ACCOUNT 属性时才惰性解析。
+def __getattr__(name: str):
+    if name == 'CURRENT_ACCOUNT':
+        return get_current_account()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# 你可以在这里添加其他全局配置变量，如全局 API 密钥等
\ No newline at end of file
+# 你可以在这里添加其他全局配置变量，如全局 API 密钥等
@@ -35,11 +35,8 @@
 # │  │  ├─ 获取当前持仓（get_current_position）
 # │  │  └─ 确认无止损止盈（check_sl_tp_orders）
 # │  │
-# │  ├─ 步骤5：设置止盈（1%）
-# │  │  └─ 调用set_take_profit_order
-# │  │
-# │  └─ 步骤6：设置止损（1%）
-# │     └─ 调用set_stop_loss_order
+# │  └─ 步骤5：一次请求同时设置止盈止损（1%）
+# │     └─ 调用attach_sl_tp_to_position（OCO条件单）
 # │
 # 结束
 
@@ -47,16 +44,26 @@
 import os
 import time
 import sys
-import json
-import hmac
-import hashlib
-import base64
-from datetime import datetime
+import orjson
+import atexit
+import queue
+import threading
+import traceback
+import pickle
+from decimal import Decimal
+from functools import lru_cache
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any, Tuple
 import ccxt
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from okx_common import ExchangeStream, find_position as find_symbol_position, to_inst_id
 
 # 加载环境变量
 env_path = '../ExApiConfig/ExApiConfig.env'
@@ -64,39 +71,117 @@ load_dotenv(dotenv_path=env_path)
 
 # 简单的日志系统
 class TestLogger:
+    FLUSH_INTERVAL = 0.5  # 后台线程刷新日志文件的间隔（秒）
+    LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
     def __init__(self, log_dir="../Output/okxSub1", file_name="Enhanced_Test_{timestamp}.log"):
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        timestamp = time.strftime('%Y%m%d_%H%M%S')
         self.log_file = f"{log_dir}/{file_name.format(timestamp=timestamp)}"
         os.makedirs(log_dir, exist_ok=True)
 
-    def log(self, level: str, message: str):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_entry = f"{timestamp} - {level} - {message}"
+        # 同一秒内的日志复用已格式化的时间前缀
+        self._last_sec = 0
+        self._prefix = ''
+
+        # 日志级别（环境变量 LOG_LEVEL，数值同标准 logging：10=DEBUG, 20=INFO, 30=WARNING, 40=ERROR）
+        self.level = int(os.getenv('LOG_LEVEL', '20'))
+        self._info_enabled = self.level <= self.LEVELS["INFO"]
+
+        # 日志文件保持打开，由后台线程批量写入，避免每条日志都打开/关闭文件
+        self._fh = open(self.log_file, 'a', encoding='utf-8', buffering=65536)
+        self._queue = queue.Queue(maxsize=10000)
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name='test_logger_writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _write_loop(self):
+        """后台写入线程：取出队列中的日志写入文件，定期刷新"""
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.FLUSH_INTERVAL)
+            except queue.Empty:
+                self._fh.flush()
+                continue
+            if entry is None:
+                break
+            self._fh.write(entry)
+            # 一次性写完队列中已有的日志
+            while True:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._fh.flush()
+                    return
+                self._fh.write(entry)
+        self._fh.flush()
+
+    def close(self):
+        """写完剩余日志并关闭文件（程序退出时自动调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        self._fh.close()
+
+    def is_info(self) -> bool:
+        """INFO 级别是否输出（用于跳过高频日志的字符串格式化）"""
+        return self._info_enabled
+
+    def log(self, level: str, message: str, *args):
+        """message 可带 %s 占位符，参数通过 args 传入，只有日志真正输出时才格式化"""
+        if self.LEVELS.get(level, 20) < self.level:
+            return
+        if args:
+            message = message % args
+        sec = int(time.time())
+        if sec != self._last_sec:
+            self._last_sec = sec
+            self._prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sec))
+        log_entry = f"{self._prefix} - {level} - {message}"
         print(log_entry)
         
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(log_entry + '\n')
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(log_entry + '\n')
+        except queue.Full:
+            # 队列已满时退化为同步写入，保证日志不丢失
+            self._queue.put(log_entry + '\n')
     
-    def info(self, message: str):
-        self.log("INFO", message)
+    def info(self, message: str, *args):
+        self.log("INFO", message, *args)
     
-    def error(self, message: str):
-        self.log("ERROR", message)
+    def error(self, message: str, *args):
+        self.log("ERROR", message, *args)
     
-    def warning(self, message: str):
-        self.log("WARNING", message)
+    def warning(self, message: str, *args):
+        self.log("WARNING", message, *args)
     
-    def debug(self, message: str):
-        self.log("DEBUG", message)
+    def debug(self, message: str, *args):
+        self.log("DEBUG", message, *args)
 
 logger = TestLogger()
 
+# 是否在错误日志中输出完整堆栈（环境变量 DEBUG_TB=1 开启）
+DEBUG_TRACEBACKS = os.getenv('DEBUG_TB', '0') == '1'
+
+def log_traceback():
+    """在 except 块中调用：开启 DEBUG_TB 时记录当前异常的完整堆栈"""
+    if DEBUG_TRACEBACKS:
+        logger.error(f"详细错误信息: {traceback.format_exc()}")
+
 # 交易配置
 class TestConfig:
     def __init__(self):
         self.symbol = 'BTC/USDT:USDT'
         self.leverage = 5
         self.test_mode = False
+        # 跳过真实交易前的人工确认（命令行 --yes 或环境变量 AUTO_CONFIRM=1），便于脚本/定时任务调用
+        self.auto_confirm = os.getenv('AUTO_CONFIRM', '0') == '1'
         self.margin_mode = 'isolated'
         self.base_usdt_amount = 1
         self.min_contract_size = None  # 将在运行时从市场信息获取
@@ -105,6 +190,12 @@ class TestConfig:
         self.price_offset_percent = 0.001
         self.wait_time_seconds = 10
         self.contract_size = 0.01
+        self.lot_size_info = None  # 缓存的最小交易单位/精度信息（首次查询后填充）
+        self.lot_step = None  # 下单数量步长（Decimal，等于最小交易量）
+        self.inst_id = self.to_inst_id(self.symbol)  # OKX合约ID，只依赖交易对，初始化时计算一次
+
+    # 将CCXT交易对转换为OKX合约ID（与 ds_final_test 共用 okx_common 中的实现）
+    to_inst_id = staticmethod(to_inst_id)
 
 # 账号配置
 def get_account_config(account_name="default"):
@@ -115,69 +206,177 @@ def get_account_config(account_name="default"):
         'password': os.getenv('OKX_PASSWORD_2')
     }
 
-# 初始化交易所
-account_config = get_account_config()
-exchange = ccxt.okx({
-    'options': {
-        'defaultType': 'swap',
-    },
-    'apiKey': account_config['api_key'],
-    'secret': account_config['secret'],
-    'password': account_config['password'],
+config = TestConfig()
+
+# 下单公共参数模板（只读）：只包含运行中不变的字段；
+# instId 随 config.symbol 变化，由各下单函数从 config.inst_id 补充，连同 side/ordType/sz 等字段
+BASE_ORDER_PARAMS = MappingProxyType({
+    'tdMode': config.margin_mode,
 })
 
-config = TestConfig()
+# 后台I/O线程池：并发执行互不依赖的交易所请求
+io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ds_debug_io')
+
+# 市场信息缓存：load_markets 会拉取全部合约信息，只在第一次需要时调用，所有交易所实例共用
+MARKETS_CACHE: Optional[Dict[str, Any]] = None
+
+# 交易所实例：导入模块时不创建，第一次使用时才初始化
+EXCHANGE = None
+
+def create_exchange(account_name="default"):
+    """创建交易所实例 - 多账号并发时每个账号一个实例，共用已加载的市场信息"""
+    account_config = get_account_config(account_name)
+    
+    # 复用HTTP连接（keep-alive连接池），避免每次下单/撤单都重新进行TCP+TLS握手
+    # 注意：urllib3 的 Retry 默认不重试 POST，下单请求不会被重复提交
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.05, status_forcelist=(502, 503, 504))
+    ))
+    session.headers['Connection'] = 'keep-alive'
+    
+    ex = ccxt.okx({
+        'options': {
+            'defaultType': 'swap',
+        },
+        'apiKey': account_config['api_key'],
+        'secret': account_config['secret'],
+        'password': account_config['password'],
+        'enableRateLimit': True,
+        'session': session,
+    })
+    
+    if MARKETS_CACHE is not None:
+        ex.set_markets(MARKETS_CACHE)
+    return ex
+
+def get_exchange():
+    """获取默认账号的交易所实例（首次调用时创建）"""
+    global EXCHANGE
+    if EXCHANGE is None:
+        EXCHANGE = create_exchange()
+    return EXCHANGE
+
+# 市场信息磁盘缓存：合约列表很少变化，跨进程复用，避免每次启动都拉取全部合约
+MARKETS_CACHE_DIR = "../Output"
+MARKETS_CACHE_TTL = 24 * 3600
+
+def load_markets_cached(ex, ttl: float = MARKETS_CACHE_TTL) -> Dict[str, Any]:
+    """
+    从磁盘缓存加载市场信息，缓存不存在或超过 ttl 秒时重新拉取并写回磁盘
+    ttl=0 强制刷新
+    """
+    cache_file = f"{MARKETS_CACHE_DIR}/markets_{ex.id}.pkl"
+    try:
+        if ttl > 0 and time.time() - os.path.getmtime(cache_file) < ttl:
+            with open(cache_file, 'rb') as f:
+                markets, currencies = pickle.load(f)
+            ex.set_markets(markets, currencies)
+            logger.debug(f"📦 从磁盘缓存加载市场信息: {cache_file}")
+            return ex.markets
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ 读取市场信息缓存失败，重新加载: {str(e)}")
+    
+    markets = ex.load_markets(reload=ttl <= 0)
+    try:
+        os.makedirs(MARKETS_CACHE_DIR, exist_ok=True)
+        # 先写临时文件再替换，避免并发读取到写了一半的缓存
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump((markets, ex.currencies), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        logger.warning(f"⚠️ 写入市场信息缓存失败: {str(e)}")
+    return markets
+
+# 连接保活：定期调用轻量的公共接口，避免等待平仓期间连接被服务端关闭，下一次下单重新握手
+KEEPALIVE_INTERVAL = 15
+KEEPALIVE_THREAD: Optional[threading.Thread] = None
+
+def _keepalive_loop():
+    while True:
+        time.sleep(KEEPALIVE_INTERVAL)
+        try:
+            get_exchange().fetch_time()
+        except Exception as e:
+            logger.debug(f"连接保活请求失败: {str(e)}")
+
+def start_keepalive():
+    """启动连接保活线程（只启动一次）"""
+    global KEEPALIVE_THREAD
+    if KEEPALIVE_THREAD is None:
+        KEEPALIVE_THREAD = threading.Thread(target=_keepalive_loop, name='exchange_keepalive', daemon=True)
+        KEEPALIVE_THREAD.start()
+
+def get_markets() -> Dict[str, Any]:
+    """获取市场信息（首次调用时从磁盘缓存或交易所加载，之后直接返回内存缓存）"""
+    global MARKETS_CACHE
+    if MARKETS_CACHE is None:
+        MARKETS_CACHE = load_markets_cached(get_exchange())
+    return MARKETS_CACHE
+
+def __getattr__(name: str):
+    # 兼容 from ds_debug import exchange 的旧用法
+    if name == 'exchange':
+        return get_exchange()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# WebSocket 推送订阅（实现见 okx_common，与 ds_final_test 共用）
+exchange_stream = ExchangeStream(config, logger, get_account_config, lambda: MARKETS_CACHE)
+
+# 日志中需要隐藏的敏感字段
+SENSITIVE_KEYS = frozenset(('apiKey', 'secret', 'password', 'signature'))
 
 def log_order_params(order_type: str, params: Dict[str, Any], function_name: str = ""):
     """记录订单参数到日志"""
     try:
-        # 隐藏敏感信息
-        safe_params = params.copy()
-        sensitive_keys = ['apiKey', 'secret', 'password', 'signature']
-        for key in sensitive_keys:
-            if key in safe_params:
-                safe_params[key] = '***'
-        
-        logger.info(f"📋 {function_name} - {order_type}订单参数:")
-        for key, value in safe_params.items():
-            logger.info(f"   {key}: {value}")
+        if not logger.is_info():
+            return
+
+        # 隐藏敏感信息（一次遍历完成复制和脱敏）
+        safe_params = {k: ('***' if k in SENSITIVE_KEYS else v) for k, v in params.items()}
+        
+        # orjson 一次性序列化整个参数字典（无法序列化的值转为字符串）
+        params_text = orjson.dumps(safe_params, option=orjson.OPT_INDENT_2, default=str).decode()
+        logger.info(f"📋 {function_name} - {order_type}订单参数:\n{params_text}")
             
     except Exception as e:
         logger.error(f"记录订单参数失败: {str(e)}")
 
 def log_api_response(response: Any, function_name: str = ""):
     """记录API响应到日志"""
+    if not logger.is_info():
+        return
     try:
-        logger.info(f"📡 {function_name} - API响应:")
+        lines = [f"📡 {function_name} - API响应:"]
         if isinstance(response, dict):
             for key, value in response.items():
                 if key == 'data' and isinstance(value, list) and len(value) > 0:
-                    logger.info(f"   {key}: [列表，共{len(value)}条记录]")
-                    for i, item in enumerate(value[:3]):
-                        logger.info(f"      [{i}]: {item}")
+                    lines.append(f"   {key}: [列表，共{len(value)}条记录]")
+                    lines.extend(f"      [{i}]: {orjson.dumps(item, default=str).decode()}"
+                                 for i, item in enumerate(value[:3]))
                 else:
-                    logger.info(f"   {key}: {value}")
+                    lines.append(f"   {key}: {value}")
         else:
-            logger.info(f"   响应: {response}")
+            lines.append(f"   响应: {response}")
+        logger.info("\n".join(lines))
     except Exception as e:
         logger.error(f"记录API响应失败: {str(e)}")
 
 def get_correct_inst_id():
-    """获取正确的合约ID"""
-    symbol = config.symbol
-    if symbol == 'BTC/USDT:USDT':
-        return 'BTC-USDT-SWAP'
-    elif symbol == 'ETH/USDT:USDT':
-        return 'ETH-USDT-SWAP'
-    else:
-        return symbol.replace('/', '-').replace(':USDT', '-SWAP')
+    """获取正确的合约ID（兼容旧接口，直接返回预先计算的 config.inst_id）"""
+    return config.inst_id
 
 def setup_exchange():
     """设置交易所参数"""
     try:
         logger.info("🔄 设置交易所参数...")
 
-        # 先获取市场信息
+        # 先获取市场信息（只加载一次，后续计算仓位时直接读缓存）
         market_info = get_lot_size_info()
         min_amount = market_info['min_amount']
         logger.info(f"📊 最小交易单位: {min_amount}")
@@ -185,6 +384,10 @@ def setup_exchange():
         # 更新配置
         config.min_contract_size = min_amount
 
+        # 提前订阅订单和行情推送，下单后可立即收到成交通知，计算仓位时直接读取最新价格
+        exchange_stream.start()
+        start_keepalive()
+
         # 设置杠杆
         leverage_params = {
             'symbol': config.symbol,
@@ -192,11 +395,12 @@ def setup_exchange():
         }
         log_order_params("设置杠杆", leverage_params, "setup_exchange")
         
-        exchange.set_leverage(config.leverage, config.symbol)
+        # 同步 ccxt 实例不是线程安全的（限流时间戳、last_http_response 等共享），两个请求依次执行
+        get_exchange().set_leverage(config.leverage, config.symbol)
         logger.info(f"✅ 杠杆设置成功: {config.leverage}x")
         
         # 获取账户余额
-        balance = exchange.fetch_balance()
+        balance = get_exchange().fetch_balance()
         usdt_balance = balance['USDT']['free']
         logger.info(f"💰 USDT余额: {usdt_balance:.2f}")
         
@@ -207,10 +411,12 @@ def setup_exchange():
         return False
 
 def get_current_price():
-    """获取当前价格"""
+    """获取当前价格 - 优先使用 WebSocket 推送的最新价格，没有时退回 REST 查询"""
     try:
-        ticker = exchange.fetch_ticker(config.symbol)
-        price = ticker['last']
+        price = exchange_stream.last_price()
+        if price is None:
+            ticker = get_exchange().fetch_ticker(config.symbol)
+            price = ticker['last']
         logger.info(f"📊 当前价格: {price:.2f}")
         return price
     except Exception as e:
@@ -218,9 +424,12 @@ def get_current_price():
         return 0
     
 def get_lot_size_info():
-    """获取交易对的最小交易单位信息"""
+    """获取交易对的最小交易单位信息（结果缓存在 config.lot_size_info）"""
+    if config.lot_size_info is not None:
+        return config.lot_size_info
+
     try:
-        markets = exchange.load_markets()
+        markets = get_markets()
         symbol = config.symbol
         
         if symbol in markets:
@@ -231,15 +440,17 @@ def get_lot_size_info():
             min_amount = amount_limits.get('min', config.min_contract_size)
             precision = market.get('precision', {}).get('amount', 4)
             
-            logger.info(f"📊 市场交易量信息:")
-            logger.info(f"   最小交易量: {min_amount}")
-            logger.info(f"   数量精度: {precision}")
+            logger.info(f"📊 市场交易量信息:\n"
+                        f"   最小交易量: {min_amount}\n"
+                        f"   数量精度: {precision}")
             
-            return {
+            config.lot_size_info = {
                 'min_amount': min_amount,
                 'precision': precision,
                 'market_info': market
             }
+            config.lot_step = Decimal(str(min_amount)) if min_amount else None
+            return config.lot_size_info
         else:
             logger.warning(f"⚠️ 未找到交易对 {symbol} 的市场信息")
             return {
@@ -255,44 +466,38 @@ def get_lot_size_info():
         }
 
 def adjust_position_size(calculated_size: float) -> float:
-    """根据市场规则调整仓位大小"""
+    """根据市场规则调整仓位大小 - 用 Decimal 向下取整到最小交易量的整数倍，避免浮点误差"""
     try:
         market_info = get_lot_size_info()
         min_amount = market_info['min_amount']
-        precision = market_info['precision']
+        if not min_amount:
+            logger.warning("⚠️ 未获取到最小交易量，仓位大小不做调整")
+            return calculated_size
         
-        logger.info(f"📏 调整仓位大小:")
-        logger.info(f"   计算大小: {calculated_size}")
-        logger.info(f"   最小交易量: {min_amount}")
-        logger.info(f"   精度: {precision}")
+        step = config.lot_step or Decimal(str(min_amount))
+        quantized = (Decimal(str(calculated_size)) // step) * step
         
         # 确保不低于最小交易量
-        if calculated_size < min_amount:
-            adjusted_size = min_amount
-            logger.info(f"   调整后: {adjusted_size} (使用最小值)")
-        else:
-            # 根据精度调整
-            adjusted_size = round(calculated_size, precision)
-            logger.info(f"   调整后: {adjusted_size}")
-        
-        # 验证是否为最小交易量的整数倍
-        if min_amount > 0:
-            multiple = adjusted_size / min_amount
-            if not multiple.is_integer():
-                # 如果不是整数倍，向下取整到最近的倍数
-                adjusted_size = (int(multiple) * min_amount)
-                logger.info(f"   最终调整: {adjusted_size} (lot size的整数倍)")
-        
+        if quantized < step:
+            quantized = step
+        adjusted_size = float(quantized)
+        
+        if logger.is_info():
+            logger.info(f"📏 调整仓位大小:\n"
+                        f"   计算大小: {calculated_size}\n"
+                        f"   最小交易量: {min_amount}\n"
+                        f"   调整后: {adjusted_size} (lot size的整数倍)")
         return adjusted_size
         
     except Exception as e:
         logger.error(f"调整仓位大小失败: {str(e)}")
         return calculated_size
 
-def calculate_position_size():
-    """计算仓位大小 - 精确计算最小可用仓位"""
+def calculate_position_size(current_price: float = None):
+    """计算仓位大小 - 精确计算最小可用仓位（调用方已取得价格时直接传入，避免重复查询）"""
     try:
-        current_price = get_current_price()
+        if current_price is None:
+            current_price = get_current_price()
         if current_price == 0:
             return config.min_contract_size
             
@@ -309,15 +514,16 @@ def calculate_position_size():
         # 根据市场规则调整大小
         contract_size = adjust_position_size(contract_size)
         
-        actual_btc = contract_size * config.contract_size
-        logger.info(f"📏 仓位计算详情:")
-        logger.info(f"   保证金: {config.base_usdt_amount} USDT")
-        logger.info(f"   杠杆: {config.leverage}x")
-        logger.info(f"   总价值: {config.base_usdt_amount * config.leverage} USDT")
-        logger.info(f"   当前价格: {current_price:.2f} USDT")
-        logger.info(f"   需要BTC: {required_btc:.8f} BTC")
-        logger.info(f"   合约张数: {contract_size} 张")
-        logger.info(f"   实际BTC: {actual_btc:.8f} BTC")
+        if logger.is_info():
+            actual_btc = contract_size * config.contract_size
+            logger.info(f"📏 仓位计算详情:\n"
+                        f"   保证金: {config.base_usdt_amount} USDT\n"
+                        f"   杠杆: {config.leverage}x\n"
+                        f"   总价值: {config.base_usdt_amount * config.leverage} USDT\n"
+                        f"   当前价格: {current_price:.2f} USDT\n"
+                        f"   需要BTC: {required_btc:.8f} BTC\n"
+                        f"   合约张数: {contract_size} 张\n"
+                        f"   实际BTC: {actual_btc:.8f} BTC")
         
         return contract_size
         
@@ -325,82 +531,95 @@ def calculate_position_size():
         logger.error(f"计算仓位大小失败: {str(e)}")
         return config.min_contract_size
 
+@lru_cache(maxsize=8)
+def get_sl_tp_multipliers(stop_loss_percent: float, take_profit_percent: float) -> Tuple[np.ndarray, np.ndarray]:
+    """止损/止盈价格相对入场价的乘数 [止损, 止盈]，返回 (多头, 空头)（按百分比缓存，配置修改后自动更新）"""
+    long_mult = np.array([1 - stop_loss_percent, 1 + take_profit_percent])
+    short_mult = np.array([1 + stop_loss_percent, 1 - take_profit_percent])
+    return long_mult, short_mult
+
 def calculate_stop_loss_take_profit_prices(side: str, entry_price: float) -> Tuple[float, float]:
     """计算止损和止盈价格"""
-    if side == 'long':  # 多头
-        stop_loss_price = entry_price * (1 - config.stop_loss_percent)
-        take_profit_price = entry_price * (1 + config.take_profit_percent)
-    else:  # 空头
-        stop_loss_price = entry_price * (1 + config.stop_loss_percent)
-        take_profit_price = entry_price * (1 - config.take_profit_percent)
+    long_mult, short_mult = get_sl_tp_multipliers(config.stop_loss_percent, config.take_profit_percent)
 
-    # 确保价格精度正确（BTC通常是1位小数）
-    stop_loss_price = round(stop_loss_price, 1)
-    take_profit_price = round(take_profit_price, 1)
+    # 一次乘法同时得到止损和止盈价格，并统一精度（BTC通常是1位小数）
+    stop_loss_price, take_profit_price = np.round(
+        entry_price * (long_mult if side == 'long' else short_mult), 1
+    ).tolist()
     
     logger.info(f"🎯 价格计算 - 入场: {entry_price:.2f}, 止损: {stop_loss_price:.2f}, 止盈: {take_profit_price:.2f}")
     return stop_loss_price, take_profit_price
 
-def create_order_with_sl_tp(side: str, amount: float, order_type: str = 'market', 
-                           limit_price: float = None, stop_loss_price: float = None, 
-                           take_profit_price: float = None):
+def format_amount(amount: float) -> str:
+    """下单数量按市场精度格式化（避免浮点误差产生的长小数被交易所拒单）"""
+    try:
+        get_markets()
+        return get_exchange().amount_to_precision(config.symbol, amount)
+    except Exception:
+        return str(amount)
+
+def format_price(price: float) -> str:
+    """价格按市场精度格式化"""
+    try:
+        get_markets()
+        return get_exchange().price_to_precision(config.symbol, price)
+    except Exception:
+        return str(price)
+
+def create_order(side: str, amount: float, order_type: str = 'market', limit_price: float = None,
+                 stop_loss_price: float = None, take_profit_price: float = None):
     """
-    创建订单并同时设置止损止盈 - 使用OKX新的attachAlgoOrds API
+    创建订单 - 同时提供止损价和止盈价时，通过OKX的attachAlgoOrds在同一请求中设置止损止盈
     """
+    with_sl_tp = stop_loss_price is not None and take_profit_price is not None
+    order_type_name = "市价单" if order_type == 'market' else "限价单"
+    sl_tp_label = "带止损止盈" if with_sl_tp else "无止损止盈"
     try:
-        inst_id = get_correct_inst_id()
-        
-        # 基础参数
-        params = {
-            'instId': inst_id,
-            'tdMode': config.margin_mode,
-            'side': side,
-            'ordType': order_type,
-            'sz': str(amount),
-        }
+        # 基础参数（数量只格式化一次，主订单和附带的止损止盈共用）
+        sz = format_amount(amount)
+        params = {**BASE_ORDER_PARAMS, 'instId': config.inst_id, 'side': side, 'ordType': order_type, 'sz': sz}
         
         # 限价单需要价格参数
         if order_type == 'limit':
             if limit_price is None:
                 logger.error("❌ 限价单必须提供limit_price参数")
                 return None
-            params['px'] = str(limit_price)
+            params['px'] = format_price(limit_price)
         
         # 添加止损止盈参数（如果提供了止损止盈价格）
-        if stop_loss_price is not None and take_profit_price is not None:
+        if with_sl_tp:
             params['attachAlgoOrds'] = [
                 {
-                    'tpTriggerPx': str(take_profit_price),
+                    'tpTriggerPx': format_price(take_profit_price),
                     'tpOrdPx': '-1',  # 市价止盈
-                    'slTriggerPx': str(stop_loss_price),
+                    'slTriggerPx': format_price(stop_loss_price),
                     'slOrdPx': '-1',  # 市价止损
                     'algoOrdType': 'conditional',  # 条件单类型
-                    'sz': str(amount),  # 止损止盈数量与主订单相同
+                    'sz': sz,  # 止损止盈数量与主订单相同
                     'side': 'buy' if side == 'short' else 'sell'  # 止损止盈方向与开仓方向相反
                 }
             ]
         
         # 记录订单参数
-        order_type_name = "市价单" if order_type == 'market' else "限价单"
-        log_order_params(f"{order_type_name}带止损止盈", params, "create_order_with_sl_tp")
+        log_order_params(f"{order_type_name}{sl_tp_label}", params, "create_order")
         
         # 记录订单详情
         if order_type == 'market':
-            logger.info(f"🎯 执行市价{side}开仓: {amount} 张")
+            logger.info(f"🎯 执行市价{side}开仓: {amount} 张 ({sl_tp_label})")
         else:
-            logger.info(f"🎯 执行限价{side}开仓: {amount} 张 @ {limit_price:.2f}")
+            logger.info(f"🎯 执行限价{side}开仓: {amount} 张 @ {limit_price:.2f} ({sl_tp_label})")
         
-        if stop_loss_price is not None:
-            logger.info(f"🛡️ 止损价格: {stop_loss_price:.2f}")
-        if take_profit_price is not None:
-            logger.info(f"🎯 止盈价格: {take_profit_price:.2f}")
+        if with_sl_tp:
+            logger.info(f"🛡️ 止损价格: {stop_loss_price:.2f}\n🎯 止盈价格: {take_profit_price:.2f}")
         
         # 使用CCXT的私有API方法调用/trade/order接口
-        response = exchange.private_post_trade_order(params)
+        response = get_exchange().private_post_trade_order(params)
         
-        log_api_response(response, "create_order_with_sl_tp")
+        log_api_response(response, "create_order")
         
         if response and response.get('code') == '0':
+            if with_sl_tp:
+                invalidate_algo_orders_cache()
             order_id = response['data'][0]['ordId'] if response.get('data') else 'Unknown'
             logger.info(f"✅ {order_type_name}创建成功: {order_id}")
             return response
@@ -410,85 +629,38 @@ def create_order_with_sl_tp(side: str, amount: float, order_type: str = 'market'
             
     except Exception as e:
         logger.error(f"{order_type_name}开仓失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        log_traceback()
         return None
 
+def create_order_with_sl_tp(side: str, amount: float, order_type: str = 'market', 
+                           limit_price: float = None, stop_loss_price: float = None, 
+                           take_profit_price: float = None):
+    """
+    创建订单并同时设置止损止盈（兼容旧接口）
+    """
+    return create_order(side, amount, order_type, limit_price, stop_loss_price, take_profit_price)
+
 def create_order_without_sl_tp(side: str, amount: float, order_type: str = 'market', 
                               limit_price: float = None):
     """
-    创建订单但不设置止损止盈
+    创建订单但不设置止损止盈（兼容旧接口）
     """
-    try:
-        inst_id = get_correct_inst_id()
-        
-        # 基础参数
-        params = {
-            'instId': inst_id,
-            'tdMode': config.margin_mode,
-            'side': side,
-            'ordType': order_type,
-            'sz': str(amount),
-        }
-        
-        # 限价单需要价格参数
-        if order_type == 'limit':
-            if limit_price is None:
-                logger.error("❌ 限价单必须提供limit_price参数")
-                return None
-            params['px'] = str(limit_price)
-        
-        # 记录订单参数
-        order_type_name = "市价单" if order_type == 'market' else "限价单"
-        log_order_params(f"{order_type_name}无止损止盈", params, "create_order_without_sl_tp")
-        
-        # 记录订单详情
-        if order_type == 'market':
-            logger.info(f"🎯 执行市价{side}开仓: {amount} 张 (无止损止盈)")
-        else:
-            logger.info(f"🎯 执行限价{side}开仓: {amount} 张 @ {limit_price:.2f} (无止损止盈)")
-        
-        # 使用CCXT的私有API方法调用/trade/order接口
-        response = exchange.private_post_trade_order(params)
-        
-        log_api_response(response, "create_order_without_sl_tp")
-        
-        if response and response.get('code') == '0':
-            order_id = response['data'][0]['ordId'] if response.get('data') else 'Unknown'
-            logger.info(f"✅ {order_type_name}创建成功: {order_id}")
-            return response
-        else:
-            logger.error(f"❌ {order_type_name}创建失败: {response}")
-            return response
-            
-    except Exception as e:
-        logger.error(f"{order_type_name}开仓失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
-        return None
+    return create_order(side, amount, order_type, limit_price)
 
 def close_position(side: str, amount: float, cancel_sl_tp=True):
     """
     平仓函数 - 增强版本，可选撤销止损止盈
     """
     try:
-        inst_id = get_correct_inst_id()
-        
         # 平仓方向与开仓方向相反
         close_side = 'buy' if side == 'short' else 'sell'
         
-        params = {
-            'instId': inst_id,
-            'tdMode': config.margin_mode,
-            'side': close_side,
-            'ordType': 'market',  # 市价平仓
-            'sz': str(amount),
-        }
+        params = {**BASE_ORDER_PARAMS, 'instId': config.inst_id, 'side': close_side, 'ordType': 'market', 'sz': format_amount(amount)}  # 市价平仓
         
         log_order_params("市价平仓", params, "close_position")
         logger.info(f"🔄 执行{side}仓位平仓: {amount} 张")
         
-        response = exchange.private_post_trade_order(params)
+        response = get_exchange().private_post_trade_order(params)
         
         log_api_response(response, "close_position")
         
@@ -511,146 +683,116 @@ def close_position(side: str, amount: float, cancel_sl_tp=True):
             
     except Exception as e:
         logger.error(f"平仓失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        log_traceback()
         return None
 
-def set_take_profit_order(side: str, amount: float, trigger_price: float):
+def attach_sl_tp_to_position(side: str, amount: float, stop_loss_price: float = None,
+                             take_profit_price: float = None):
     """
-    设置止盈订单
+    为已有持仓设置止损止盈 - 一次请求同时提交止损和止盈
+    同时提供止损和止盈时使用OCO条件单，只提供一个时使用普通条件单
     """
     try:
-        inst_id = get_correct_inst_id()
-        
-        # 止盈方向与开仓方向相反
-        tp_side = 'buy' if side == 'short' else 'sell'
+        if stop_loss_price is None and take_profit_price is None:
+            logger.error("❌ 止损价和止盈价至少需要提供一个")
+            return None
+
+        # 止损止盈方向与开仓方向相反
+        close_side = 'buy' if side == 'short' else 'sell'
         
-        params = {
-            'instId': inst_id,
-            'tdMode': config.margin_mode,
-            'side': tp_side,
-            'ordType': 'conditional',
-            'sz': str(amount),
-            'tpTriggerPx': str(trigger_price),
-            'tpOrdPx': '-1',  # 市价止盈
-        }
+        ord_type = 'oco' if stop_loss_price is not None and take_profit_price is not None else 'conditional'
+        params = {**BASE_ORDER_PARAMS, 'instId': config.inst_id, 'side': close_side, 'ordType': ord_type, 'sz': format_amount(amount)}
+        if take_profit_price is not None:
+            params['tpTriggerPx'] = format_price(take_profit_price)
+            params['tpOrdPx'] = '-1'  # 市价止盈
+        if stop_loss_price is not None:
+            params['slTriggerPx'] = format_price(stop_loss_price)
+            params['slOrdPx'] = '-1'  # 市价止损
         
-        log_order_params("设置止盈", params, "set_take_profit_order")
-        logger.info(f"🎯 设置止盈: {trigger_price:.2f}, 方向: {tp_side}, 数量: {amount}")
+        log_order_params("设置止损止盈", params, "attach_sl_tp_to_position")
+        if take_profit_price is not None:
+            logger.info(f"🎯 设置止盈: {take_profit_price:.2f}, 方向: {close_side}, 数量: {amount}")
+        if stop_loss_price is not None:
+            logger.info(f"🛡️ 设置止损: {stop_loss_price:.2f}, 方向: {close_side}, 数量: {amount}")
         
-        response = exchange.private_post_trade_order_algo(params)
+        response = get_exchange().private_post_trade_order_algo(params)
         
-        log_api_response(response, "set_take_profit_order")
+        log_api_response(response, "attach_sl_tp_to_position")
         
         if response and response.get('code') == '0':
+            invalidate_algo_orders_cache()
             algo_id = response['data'][0]['algoId'] if response.get('data') else 'Unknown'
-            logger.info(f"✅ 止盈订单设置成功: {algo_id}")
+            logger.info(f"✅ 止损止盈订单设置成功: {algo_id}")
             return response
         else:
-            logger.error(f"❌ 止盈订单设置失败: {response}")
+            logger.error(f"❌ 止损止盈订单设置失败: {response}")
             return response
             
     except Exception as e:
-        logger.error(f"设置止盈失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        logger.error(f"设置止损止盈失败: {str(e)}")
+        log_traceback()
         return None
 
+def set_take_profit_order(side: str, amount: float, trigger_price: float):
+    """
+    设置止盈订单（兼容旧接口）
+    """
+    return attach_sl_tp_to_position(side, amount, take_profit_price=trigger_price)
+
 def set_stop_loss_order(side: str, amount: float, trigger_price: float):
     """
-    设置止损订单
+    设置止损订单（兼容旧接口）
     """
+    return attach_sl_tp_to_position(side, amount, stop_loss_price=trigger_price)
+
+def get_current_position():
+    """获取当前持仓 - 改进版本"""
     try:
-        inst_id = get_correct_inst_id()
-        
-        # 止损方向与开仓方向相反
-        sl_side = 'buy' if side == 'short' else 'sell'
-        
-        params = {
-            'instId': inst_id,
-            'tdMode': config.margin_mode,
-            'side': sl_side,
-            'ordType': 'conditional',
-            'sz': str(amount),
-            'slTriggerPx': str(trigger_price),
-            'slOrdPx': '-1',  # 市价止损
-        }
-        
-        log_order_params("设置止损", params, "set_stop_loss_order")
-        logger.info(f"🛡️ 设置止损: {trigger_price:.2f}, 方向: {sl_side}, 数量: {amount}")
-        
-        response = exchange.private_post_trade_order_algo(params)
-        
-        log_api_response(response, "set_stop_loss_order")
-        
-        if response and response.get('code') == '0':
-            algo_id = response['data'][0]['algoId'] if response.get('data') else 'Unknown'
-            logger.info(f"✅ 止损订单设置成功: {algo_id}")
-            return response
-        else:
-            logger.error(f"❌ 止损订单设置失败: {response}")
-            return response
-            
+        # 只查询目标交易对的持仓，减少返回数据量
+        positions = get_exchange().fetch_positions([config.symbol])
+        return parse_current_position(positions)
     except Exception as e:
-        logger.error(f"设置止损失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        logger.error(f"获取持仓失败: {str(e)}")
         return None
 
-def get_current_position():
-    """获取当前持仓 - 改进版本"""
+def find_position(positions) -> Optional[Dict[str, Any]]:
+    """在持仓列表中查找目标交易对的有效持仓（不记录日志）"""
+    return find_symbol_position(positions, config.symbol, config.leverage)
+
+def parse_current_position(positions):
+    """从 fetch_positions 的结果中解析目标交易对的持仓（不做网络请求）"""
     try:
-        # 使用CCXT的fetch_positions方法获取所有持仓
-        positions = exchange.fetch_positions()
-        
+        target_symbol = config.symbol
         if not positions:
             logger.info("📊 没有找到任何持仓")
             return None
         
-        # 查找当前交易对的持仓
-        target_symbol = config.symbol
-        logger.info(f"📊 查找持仓: {target_symbol}")
-        
-        for pos in positions:
-            symbol = pos.get('symbol', '')
-            contracts = float(pos.get('contracts', 0))
-            
-            # 记录所有持仓信息用于调试
-            logger.info(f"📊 持仓信息: 符号={symbol}, 合约数={contracts}, 方向={pos.get('side')}, 入场价={pos.get('entryPrice')}")
-            
-            # 检查是否为目标交易对且有持仓
-            if symbol == target_symbol and contracts > 0:
-                position_info = {
-                    'side': pos.get('side', 'unknown'),
-                    'size': contracts,
-                    'entry_price': float(pos.get('entryPrice', 0)),
-                    'unrealized_pnl': float(pos.get('unrealizedPnl', 0)),
-                    'leverage': float(pos.get('leverage', config.leverage))
-                }
-                logger.info(f"✅ 找到目标持仓: {position_info}")
-                return position_info
+        position_info = find_position(positions)
+        if position_info:
+            if logger.is_info():
+                logger.info(f"📊 查找持仓: {target_symbol}\n✅ 找到目标持仓: {position_info}")
+            return position_info
         
-        logger.info("❌ 未找到目标交易对的持仓")
+        if logger.is_info():
+            logger.info(f"📊 查找持仓: {target_symbol} (共{len(positions)}条持仓记录)\n❌ 未找到目标交易对的持仓")
         return None
         
     except Exception as e:
-        logger.error(f"获取持仓失败: {str(e)}")
+        logger.error(f"解析持仓失败: {str(e)}")
         return None
 
+# 条件单类型查表：下标 = (有止盈 << 1) | 有止损
+ALGO_ORDER_KINDS = ("其他条件单", "止损", "止盈", "OCO")
+
+def algo_order_kind(order) -> int:
+    """根据止盈/止损触发价字段是否存在，返回 ALGO_ORDER_KINDS 的下标"""
+    return (bool(order.get('tpTriggerPx')) << 1) | bool(order.get('slTriggerPx'))
+
 def analyze_algo_order_type(order):
     """智能分析条件单类型"""
-    algo_id = order.get('algoId', 'Unknown')
-    
-    # 判断订单类型（通过字段存在性判断）
-    has_tp = order.get('tpTriggerPx') not in [None, '']
-    has_sl = order.get('slTriggerPx') not in [None, '']
-    
-    if has_tp and has_sl:
-        return "OCO"
-    elif has_sl:
-        return "止损"
-    elif has_tp:
-        return "止盈"
+    kind = algo_order_kind(order)
+    if kind:
+        return ALGO_ORDER_KINDS[kind]
     else:
         # 进一步检查其他条件单类型
         ord_type = order.get('ordType', '')
@@ -663,20 +805,69 @@ def analyze_algo_order_type(order):
         else:
             return "其他条件单"
 
+# 条件单查询公共参数模板（只读）：永续合约的止损止盈条件单，使用时补充 instId
+ALGO_PENDING_PARAMS = MappingProxyType({
+    'instType': 'SWAP',
+    'ordType': 'conditional,oco',
+})
+
+# 条件单查询结果短时缓存：按查询参数区分，同一阶段内的多次检查复用一次查询，下单/撤单成功后失效
+ALGO_ORDERS_CACHE_TTL = 1.0
+ALGO_ORDERS_CACHE: Dict[Tuple, Tuple[float, Dict[str, Any]]] = {}
+
+def invalidate_algo_orders_cache():
+    """条件单有变化（设置/撤销）后调用，下次查询重新请求交易所"""
+    ALGO_ORDERS_CACHE.clear()
+
+def fetch_algo_orders_pending(params: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+    """
+    查询未触发的条件单，返回原始响应（相同参数1秒内重复查询直接返回缓存）
+    use_cache=False 时一定请求交易所（结果仍写入缓存）：用于验证和撤销前的查询，
+    因为调用方（如 ds_sltp_test）可能绕过本模块直接下条件单，缓存不会因此失效
+    """
+    key = tuple(sorted(params.items()))
+    cached = ALGO_ORDERS_CACHE.get(key) if use_cache else None
+    if cached is not None and time.monotonic() - cached[0] < ALGO_ORDERS_CACHE_TTL:
+        return cached[1]
+    
+    response = get_exchange().private_get_trade_orders_algo_pending(params)
+    if response and response.get('code') == '0':
+        ALGO_ORDERS_CACHE[key] = (time.monotonic(), response)
+    return response
+
+def fetch_pending_algo_orders(use_cache: bool = True):
+    """查询当前品种未触发的止损止盈条件单，返回原始响应"""
+    # 只查询特定品种
+    return fetch_algo_orders_pending({**ALGO_PENDING_PARAMS, 'instId': config.inst_id}, use_cache)
+
+def fetch_account_snapshot(include_open_orders: bool = True):
+    """
+    并发查询持仓、止损止盈条件单和普通挂单 - 三个请求互不依赖，
+    耗时由三次往返之和降为其中最慢的一次
+    返回 (positions, algo_response, open_orders)，include_open_orders=False 时不查询挂单，open_orders 为 None
+    任一请求失败时抛出异常
+    """
+    positions_future = io_executor.submit(get_exchange().fetch_positions, [config.symbol])
+    algos_future = io_executor.submit(fetch_pending_algo_orders)
+    opens_future = io_executor.submit(get_exchange().fetch_open_orders, config.symbol) if include_open_orders else None
+    return (positions_future.result(), algos_future.result(),
+            opens_future.result() if opens_future else None)
+
 def check_sl_tp_orders():
     """检查止损止盈订单状态 - 修复版本，支持OCO和特定品种过滤"""
     try:
-        inst_id = get_correct_inst_id()
-        
-        # 使用条件单查询API来检查止损止盈订单
-        params = {
-            'instType': 'SWAP',  # 永续合约
-            'instId': inst_id,   # 只查询特定品种
-            'ordType': 'conditional,oco',  # 条件单类型
-        }
-        
-        logger.info(f"📋 查询 {inst_id} 的止损止盈条件单...")
-        response = exchange.private_get_trade_orders_algo_pending(params)
+        logger.info(f"📋 查询 {config.inst_id} 的止损止盈条件单...")
+        # 验证性查询，不使用缓存
+        return report_sl_tp_orders(fetch_pending_algo_orders(use_cache=False))
+    except Exception as e:
+        logger.error(f"检查止损止盈订单失败: {str(e)}")
+        log_traceback()
+        return False
+
+def report_sl_tp_orders(response):
+    """分析条件单查询结果并分类显示（不做网络请求），有止损止盈单时返回 True"""
+    try:
+        inst_id = config.inst_id
         
         if response and response.get('code') == '0':
             orders = response.get('data', [])
@@ -684,49 +875,17 @@ def check_sl_tp_orders():
             if orders:
                 logger.info(f"✅ 发现止损止盈条件单: {len(orders)}个")
                 
-                # 分类显示订单
-                sl_orders = []
-                tp_orders = [] 
-                oco_orders = []
-                other_orders = []
-                
+                # 分类显示订单（按 ALGO_ORDER_KINDS 下标分桶）
+                buckets = [[], [], [], []]
                 for order in orders:
-                    # 判断订单类型（通过字段存在性判断）
-                    has_tp = order.get('tpTriggerPx') not in [None, '']
-                    has_sl = order.get('slTriggerPx') not in [None, '']
-                    
-                    if has_tp and has_sl:
-                        oco_orders.append(order)
-                    elif has_sl:
-                        sl_orders.append(order)
-                    elif has_tp:
-                        tp_orders.append(order)
-                    else:
-                        other_orders.append(order)
-                
-                # 显示止损订单
-                if sl_orders:
-                    logger.info(f"   🛡️ 止损订单 ({len(sl_orders)}个):")
-                    for order in sl_orders:
-                        _log_algo_order_detail(order)
-                
-                # 显示止盈订单
-                if tp_orders:
-                    logger.info(f"   🎯 止盈订单 ({len(tp_orders)}个):")
-                    for order in tp_orders:
-                        _log_algo_order_detail(order)
-                
-                # 显示OCO订单
-                if oco_orders:
-                    logger.info(f"   🔄 OCO订单 ({len(oco_orders)}个):")
-                    for order in oco_orders:
-                        _log_algo_order_detail(order)
+                    buckets[algo_order_kind(order)].append(order)
                 
-                # 显示其他类型订单
-                if other_orders:
-                    logger.info(f"   ❓ 其他条件单 ({len(other_orders)}个):")
-                    for order in other_orders:
-                        _log_algo_order_detail(order)
+                # 依次显示止损、止盈、OCO、其他类型订单
+                for kind, title in ((1, "🛡️ 止损订单"), (2, "🎯 止盈订单"), (3, "🔄 OCO订单"), (0, "❓ 其他条件单")):
+                    if buckets[kind]:
+                        logger.info(f"   {title} ({len(buckets[kind])}个):")
+                        for order in buckets[kind]:
+                            _log_algo_order_detail(order)
                 
                 return True
             else:
@@ -737,13 +896,14 @@ def check_sl_tp_orders():
             return False
             
     except Exception as e:
-        logger.error(f"检查止损止盈订单失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        logger.error(f"分析止损止盈订单失败: {str(e)}")
+        log_traceback()
         return False
 
 def _log_algo_order_detail(order):
     """记录条件单详细信息 - 改进版本"""
+    if not logger.is_info():
+        return
     algo_id = order.get('algoId', 'Unknown')
     order_type = analyze_algo_order_type(order)
     state = order.get('state', 'Unknown')
@@ -751,84 +911,75 @@ def _log_algo_order_detail(order):
     pos_side = order.get('posSide', 'Unknown')
     sz = order.get('sz', 'Unknown')
     
-    logger.info(f"      ID: {algo_id}")
-    logger.info(f"       类型: {order_type}")
-    logger.info(f"       状态: {state}")
-    logger.info(f"       方向: {side}/{pos_side}")
-    logger.info(f"       数量: {sz}")
+    lines = [
+        f"      ID: {algo_id}",
+        f"       类型: {order_type}",
+        f"       状态: {state}",
+        f"       方向: {side}/{pos_side}",
+        f"       数量: {sz}",
+    ]
     
     # 根据类型显示不同的价格信息
     if order_type == "OCO":
-        logger.info(f"       止损触发: {order.get('slTriggerPx', 'Unknown')}, 委托: {order.get('slOrdPx', 'Unknown')}")
-        logger.info(f"       止盈触发: {order.get('tpTriggerPx', 'Unknown')}, 委托: {order.get('tpOrdPx', 'Unknown')}")
+        lines.append(f"       止损触发: {order.get('slTriggerPx', 'Unknown')}, 委托: {order.get('slOrdPx', 'Unknown')}")
+        lines.append(f"       止盈触发: {order.get('tpTriggerPx', 'Unknown')}, 委托: {order.get('tpOrdPx', 'Unknown')}")
     elif order_type == "止损":
-        logger.info(f"       触发价: {order.get('slTriggerPx', 'Unknown')}")
-        logger.info(f"       委托价: {order.get('slOrdPx', 'Unknown')}")
+        lines.append(f"       触发价: {order.get('slTriggerPx', 'Unknown')}")
+        lines.append(f"       委托价: {order.get('slOrdPx', 'Unknown')}")
     elif order_type == "止盈":
-        logger.info(f"       触发价: {order.get('tpTriggerPx', 'Unknown')}")
-        logger.info(f"       委托价: {order.get('tpOrdPx', 'Unknown')}")
+        lines.append(f"       触发价: {order.get('tpTriggerPx', 'Unknown')}")
+        lines.append(f"       委托价: {order.get('tpOrdPx', 'Unknown')}")
     else:
-        logger.info(f"       触发价: {order.get('triggerPx', 'Unknown')}")
-        logger.info(f"       委托价: {order.get('ordPx', 'Unknown')}")
+        lines.append(f"       触发价: {order.get('triggerPx', 'Unknown')}")
+        lines.append(f"       委托价: {order.get('ordPx', 'Unknown')}")
+    logger.info("\n".join(lines))
 
 def create_oco_order(side: str, amount: float, stop_loss_price: float, take_profit_price: float):
     """
-    创建OCO订单（一个订单同时设置止损和止盈）
+    创建OCO订单（一个订单同时设置止损和止盈，兼容旧接口）
     """
-    try:
-        inst_id = get_correct_inst_id()
-        
-        # OCO订单参数
-        params = {
-            'instId': inst_id,
-            'tdMode': config.margin_mode,
-            'side': 'buy' if side == 'short' else 'sell',  # 平仓方向
-            'ordType': 'oco',  # OCO订单类型
-            'sz': str(amount),
-            'tpTriggerPx': str(take_profit_price),
-            'tpOrdPx': '-1',  # 市价止盈
-            'slTriggerPx': str(stop_loss_price),
-            'slOrdPx': '-1',  # 市价止损
-        }
-        
-        log_order_params("OCO订单", params, "create_oco_order")
-        logger.info(f"🔄 创建OCO订单: {side} {amount}张")
-        logger.info(f"   止损: {stop_loss_price:.2f}")
-        logger.info(f"   止盈: {take_profit_price:.2f}")
-        
-        response = exchange.private_post_trade_order_algo(params)
-        
-        log_api_response(response, "create_oco_order")
-        
-        if response and response.get('code') == '0':
-            algo_id = response['data'][0]['algoId'] if response.get('data') else 'Unknown'
-            logger.info(f"✅ OCO订单创建成功: {algo_id}")
-            return response
+    return attach_sl_tp_to_position(side, amount, stop_loss_price=stop_loss_price,
+                                    take_profit_price=take_profit_price)
+
+# OKX cancel-algos 接口单次最多撤销的条件单数量
+CANCEL_ALGOS_BATCH_SIZE = 20
+
+# OKX cancel-batch-orders 接口单次最多撤销的普通订单数量
+CANCEL_ORDERS_BATCH_SIZE = 20
+
+def cancel_algo_orders(algo_ids) -> int:
+    """批量撤销条件单：OKX 单次最多20个，一次请求撤销一批，返回撤销成功的数量"""
+    inst_id = config.inst_id
+    cancel_params = [{'algoId': algo_id, 'instId': inst_id} for algo_id in algo_ids if algo_id]
+    
+    cancel_count = 0
+    for i in range(0, len(cancel_params), CANCEL_ALGOS_BATCH_SIZE):
+        batch = cancel_params[i:i + CANCEL_ALGOS_BATCH_SIZE]
+        cancel_response = get_exchange().private_post_trade_cancel_algos(batch)
+        invalidate_algo_orders_cache()
+        
+        if cancel_response and cancel_response.get('code') in ('0', '2'):
+            # code '2' 表示部分成功，逐条检查 sCode
+            for item in cancel_response.get('data', []):
+                algo_id = item.get('algoId')
+                if item.get('sCode', '0') == '0':
+                    logger.info(f"✅ 已撤销条件单: {algo_id}")
+                    cancel_count += 1
+                else:
+                    logger.error(f"❌ 撤销条件单失败: {algo_id} - {item.get('sMsg')}")
         else:
-            logger.error(f"❌ OCO订单创建失败: {response}")
-            return response
-            
-    except Exception as e:
-        logger.error(f"创建OCO订单失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
-        return None
+            logger.error(f"❌ 撤销条件单失败: {[p['algoId'] for p in batch]} - {cancel_response}")
+    return cancel_count
 
 def cancel_all_sl_tp_orders():
     """撤销所有止损止盈订单"""
     try:
-        inst_id = get_correct_inst_id()
+        inst_id = config.inst_id
         
         logger.info(f"🔄 撤销 {inst_id} 的所有止损止盈订单...")
         
-        # 获取所有待处理的条件单
-        params = {
-            'instType': 'SWAP',
-            'instId': inst_id,
-            'ordType': 'conditional,oco',
-        }
-        
-        response = exchange.private_get_trade_orders_algo_pending(params)
+        # 获取所有待处理的条件单（不使用缓存，避免漏撤刚刚直接下的条件单）
+        response = fetch_pending_algo_orders(use_cache=False)
         
         if response and response.get('code') == '0':
             orders = response.get('data', [])
@@ -837,26 +988,7 @@ def cancel_all_sl_tp_orders():
                 logger.info(f"✅ 没有找到需要撤销的止损止盈订单")
                 return True
             
-            cancel_count = 0
-            for order in orders:
-                algo_id = order.get('algoId')
-                if algo_id:
-                    # 撤销单个条件单 - 使用正确的CCXT方法
-                    cancel_params = [
-                        {
-                            'algoId': algo_id,
-                            'instId': inst_id,
-                        }
-                    ]
-                    
-                    # 使用批量撤销条件单的API
-                    cancel_response = exchange.private_post_trade_cancel_algos(cancel_params)
-                    
-                    if cancel_response and cancel_response.get('code') == '0':
-                        logger.info(f"✅ 已撤销条件单: {algo_id}")
-                        cancel_count += 1
-                    else:
-                        logger.error(f"❌ 撤销条件单失败: {algo_id} - {cancel_response}")
+            cancel_count = cancel_algo_orders(order.get('algoId') for order in orders)
             
             logger.info(f"📊 总计撤销 {cancel_count}/{len(orders)} 个条件单")
             return cancel_count > 0
@@ -866,14 +998,13 @@ def cancel_all_sl_tp_orders():
             
     except Exception as e:
         logger.error(f"撤销止损止盈订单失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        log_traceback()
         return False
 
 def cancel_specific_algo_order(algo_id: str):
     """撤销特定的条件单"""
     try:
-        inst_id = get_correct_inst_id()
+        inst_id = config.inst_id
         
         # 使用批量撤销API，即使只有一个订单
         cancel_params = [
@@ -886,7 +1017,8 @@ def cancel_specific_algo_order(algo_id: str):
         logger.info(f"🔄 撤销特定条件单: {algo_id}")
         
         # 使用批量撤销条件单的API
-        response = exchange.private_post_trade_cancel_algos(cancel_params)
+        response = get_exchange().private_post_trade_cancel_algos(cancel_params)
+        invalidate_algo_orders_cache()
         
         if response and response.get('code') == '0':
             logger.info(f"✅ 条件单撤销成功: {algo_id}")
@@ -906,33 +1038,66 @@ def cancel_existing_orders():
         logger.info("🔄 取消现有订单...")
         
         # 获取待处理订单
-        pending_orders = exchange.fetch_open_orders(config.symbol)
-        
+        cancel_open_orders(get_exchange().fetch_open_orders(config.symbol))
+                    
+    except Exception as e:
+        logger.error(f"取消订单失败: {str(e)}")
+
+def cancel_open_orders(pending_orders):
+    """批量取消已查询到的待处理订单（不重新查询）"""
+    try:
         if pending_orders:
             for order in pending_orders:
-                order_id = order.get('id')
-                logger.info(f"📋 发现待处理订单: {order_id} - {order.get('side')} {order.get('amount')}")
+                logger.info(f"📋 发现待处理订单: {order.get('id')} - {order.get('side')} {order.get('amount')}")
+            
+            # 批量撤单：OKX 单次最多20个
+            inst_id = config.inst_id
+            cancel_params = [{'instId': inst_id, 'ordId': order.get('id')} for order in pending_orders]
+            for i in range(0, len(cancel_params), CANCEL_ORDERS_BATCH_SIZE):
+                batch = cancel_params[i:i + CANCEL_ORDERS_BATCH_SIZE]
+                cancel_response = get_exchange().private_post_trade_cancel_batch_orders(batch)
                 
-                # 取消订单
-                cancel_result = exchange.cancel_order(order_id, config.symbol)
-                if cancel_result:
-                    logger.info(f"✅ 取消订单成功: {order_id}")
+                if cancel_response and cancel_response.get('code') in ('0', '2'):
+                    for item in cancel_response.get('data', []):
+                        order_id = item.get('ordId')
+                        if item.get('sCode', '0') == '0':
+                            logger.info(f"✅ 取消订单成功: {order_id}")
+                        else:
+                            logger.warning(f"⚠️ 取消订单失败: {order_id} - {item.get('sMsg')}")
                 else:
-                    logger.warning(f"⚠️ 取消订单失败: {order_id}")
+                    logger.warning(f"⚠️ 取消订单失败: {[p['ordId'] for p in batch]} - {cancel_response}")
         else:
             logger.info("✅ 没有找到待取消的订单")
                     
     except Exception as e:
         logger.error(f"取消订单失败: {str(e)}")
 
+# REST 轮询退避参数（秒）
+POLL_MIN_DELAY = 0.25
+POLL_MAX_DELAY = 3.0
+POLL_BACKOFF = 1.5
+
 def wait_for_order_fill(order_id: str, timeout: int = 60) -> bool:
-    """等待订单成交"""
+    """等待订单成交 - 优先等待 WebSocket 推送，收不到推送时退回 REST 轮询"""
     logger.info(f"⏳ 等待订单 {order_id} 成交...")
     
-    start_time = time.time()
-    while time.time() - start_time < timeout:
+    # 超时使用单调时钟计算，不受系统时间调整影响
+    deadline = time.monotonic() + timeout
+
+    # 先等待推送（最多一个轮询周期），推送可能在订阅建立前错过，之后用 REST 兜底
+    status = exchange_stream.wait(order_id, min(3, timeout))
+    if status == 'closed':
+        logger.info(f"✅ 订单已成交: {order_id}")
+        return True
+    elif status == 'canceled':
+        logger.warning(f"❌ 订单已取消: {order_id}")
+        return False
+
+    # 轮询间隔从 0.25 秒开始按 1.5 倍递增，最长 3 秒：快速成交时尽快返回，挂单较久时不浪费请求额度
+    delay = POLL_MIN_DELAY
+    while time.monotonic() < deadline:
         try:
-            order = exchange.fetch_order(order_id, config.symbol)
+            order = get_exchange().fetch_order(order_id, config.symbol)
             status = order['status']
             
             if status == 'closed':
@@ -943,12 +1108,12 @@ def wait_for_order_fill(order_id: str, timeout: int = 60) -> bool:
                 return False
             else:
                 logger.info(f"📊 订单状态: {status}, 等待中...")
-                
-            time.sleep(3)  # 每3秒检查一次
             
         except Exception as e:
             logger.error(f"检查订单状态失败: {str(e)}")
-            time.sleep(3)
+        
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
     
     logger.warning(f"⏰ 订单等待超时: {order_id}")
     return False
@@ -957,31 +1122,65 @@ def wait_for_position(side: str, timeout: int = 30) -> Dict[str, Any]:
     """等待持仓出现"""
     logger.info(f"⏳ 等待{side}持仓出现...")
     
-    start_time = time.time()
-    while time.time() - start_time < timeout:
+    deadline = time.monotonic() + timeout
+
+    # 先等待持仓推送，没有订阅或推送未到时用 REST 兜底
+    matched, position = exchange_stream.wait_position(
+        lambda p: p is not None and p['side'] == side, min(5, timeout))
+    if matched:
+        logger.info(f"✅ {side}持仓已建立")
+        return position
+
+    delay = POLL_MIN_DELAY
+    while time.monotonic() < deadline:
         position = get_current_position()
         if position and position['side'] == side:
             logger.info(f"✅ {side}持仓已建立")
             return position
-        time.sleep(2)  # 每2秒检查一次
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
     
     logger.error(f"❌ {side}持仓未在{timeout}秒内出现")
     return None
 
+def wait_for_position_gone(timeout: float = 5, initial_delay: float = 0.1) -> Optional[Dict[str, Any]]:
+    """
+    等待平仓后持仓消失 - 优先等待持仓推送，否则按 0.1, 0.2, 0.4... 秒退避轮询
+    持仓已消失返回 None，超时返回最后查询到的持仓
+    """
+    deadline = time.monotonic() + timeout
+    # 推送通常在平仓成交后立即到达，最多等1秒，剩余时间用 REST 兜底
+    matched, _ = exchange_stream.wait_position(lambda p: p is None, min(1, timeout))
+    if matched:
+        return None
+
+    delay = initial_delay
+    while True:
+        position = get_current_position()
+        remaining = deadline - time.monotonic()
+        if not position or remaining <= 0:
+            return position
+        time.sleep(min(delay, remaining))
+        delay *= 2
+
 
 def verify_sl_tp_setup(expected_sl_tp_count=2):
     """验证止损止盈设置是否正确 - 支持OCO和独立订单"""
     try:
         logger.info("🔍 验证止损止盈设置...")
         
-        # 检查持仓
-        position = get_current_position()
+        # 最终验证必须读取交易所最新状态
+        invalidate_algo_orders_cache()
+        
+        # 并发查询持仓和止损止盈订单
+        positions, algo_response, _ = fetch_account_snapshot(include_open_orders=False)
+        position = parse_current_position(positions)
         if not position:
             logger.warning("⚠️ 无持仓，无法验证止损止盈")
             return False
         
         # 检查止损止盈订单
-        has_sl_tp = check_sl_tp_orders()
+        has_sl_tp = report_sl_tp_orders(algo_response)
         
         if has_sl_tp:
             logger.info("✅ 止损止盈验证通过 - 发现止损止盈订单")
@@ -1004,7 +1203,7 @@ def get_specific_algo_order(algo_id: str):
             'algoId': algo_id,
         }
         
-        response = exchange.private_get_trade_order_algo(params)
+        response = get_exchange().private_get_trade_order_algo(params)
         
         if response and response.get('code') == '0':
             orders = response.get('data', [])
@@ -1021,19 +1220,18 @@ def get_specific_algo_order(algo_id: str):
 def verify_by_algo_history():
     """通过条件单历史记录验证"""
     try:
-        inst_id = get_correct_inst_id()
-        
+        # 由交易所按 instId 过滤，不再拉取全部品种的条件单后本地筛选
         params = {
-            'instType': 'SWAP',
+            **ALGO_PENDING_PARAMS,
+            'instId': config.inst_id,
             'ordType': 'conditional',
             'state': 'live',  # 存活状态
         }
         
-        response = exchange.private_get_trade_orders_algo_pending(params)
+        response = fetch_algo_orders_pending(params)
         
         if response and response.get('code') == '0':
-            orders = response.get('data', [])
-            target_orders = [o for o in orders if o.get('instId') == inst_id]
+            target_orders = response.get('data', [])
             
             if target_orders:
                 logger.info(f"📊 通过条件单历史找到 {len(target_orders)} 个活跃订单")
@@ -1045,10 +1243,27 @@ def verify_by_algo_history():
     except Exception as e:
         logger.error(f"通过条件单历史验证失败: {str(e)}")
 
+# get_market_info 结果缓存，按交易对区分
+MARKET_INFO_CACHE: Dict[str, Dict[str, Any]] = {}
+
+def clear_market_caches():
+    """
+    清空按交易对缓存的市场信息（修改 config.symbol 后调用）
+    下单参数的 instId 在下单时从 config.inst_id 读取，这里更新后新订单即使用新合约
+    """
+    MARKET_INFO_CACHE.clear()
+    config.inst_id = TestConfig.to_inst_id(config.symbol)
+    config.lot_size_info = None
+    config.lot_step = None
+
 def get_market_info():
-    """获取市场信息，包括最小交易量"""
+    """获取市场信息，包括最小交易量（结果按交易对缓存）"""
+    cached = MARKET_INFO_CACHE.get(config.symbol)
+    if cached is not None:
+        return cached
+
     try:
-        markets = exchange.load_markets()
+        markets = get_markets()
         symbol = config.symbol
         if symbol in markets:
             market = markets[symbol]
@@ -1059,13 +1274,15 @@ def get_market_info():
             
             logger.info(f"📊 市场信息 - 最小数量: {min_amount}")
             logger.info(f"📊 市场信息 - 数量精度: {precision}")
-            logger.info(f"📊 市场信息 - 完整信息: {market}")
+            # 完整市场信息只用于排查问题，降为 DEBUG 并延迟格式化
+            logger.debug("📊 市场信息 - 完整信息: %s", market)
             
-            return {
+            MARKET_INFO_CACHE[symbol] = {
                 'min_amount': min_amount,
                 'precision': precision,
                 'market_info': market
             }
+            return MARKET_INFO_CACHE[symbol]
         return None
     except Exception as e:
         logger.error(f"获取市场信息失败: {str(e)}")
@@ -1119,10 +1336,9 @@ def test_minimum_order():
 def manage_sl_tp_orders():
     """止损止盈订单管理函数"""
     try:
-        inst_id = get_correct_inst_id()
-        
-        # 获取当前持仓
-        position = get_current_position()
+        # 并发获取当前持仓和止损止盈订单
+        positions, response, _ = fetch_account_snapshot(include_open_orders=False)
+        position = parse_current_position(positions)
         if not position:
             logger.info("📊 当前无持仓，检查是否需要清理止损止盈订单...")
             # 无持仓时撤销所有止损止盈订单
@@ -1131,15 +1347,6 @@ def manage_sl_tp_orders():
         # 有持仓时，检查止损止盈订单是否匹配
         logger.info(f"📊 当前持仓: {position['side']} {position['size']}张")
         
-        # 获取所有止损止盈订单
-        params = {
-            'instType': 'SWAP',
-            'instId': inst_id,
-            'ordType': 'conditional,oco',
-        }
-        
-        response = exchange.private_get_trade_orders_algo_pending(params)
-        
         if response and response.get('code') == '0':
             orders = response.get('data', [])
             
@@ -1148,28 +1355,19 @@ def manage_sl_tp_orders():
                 return True
             
             # 检查订单是否与持仓匹配
+            # 多头持仓：止损止盈应该是卖出
+            # 空头持仓：止损止盈应该是买入
+            expected_side = {'long': 'sell', 'short': 'buy'}.get(position['side'])
             valid_orders = []
             invalid_orders = []
-            
             for order in orders:
-                order_side = order.get('side', '')
-                order_size = float(order.get('sz', 0))
-                
-                # 判断订单方向是否与持仓匹配
-                # 多头持仓：止损止盈应该是卖出
-                # 空头持仓：止损止盈应该是买入
-                if position['side'] == 'long' and order_side == 'sell':
-                    valid_orders.append(order)
-                elif position['side'] == 'short' and order_side == 'buy':
-                    valid_orders.append(order)
-                else:
-                    invalid_orders.append(order)
+                (valid_orders if order.get('side') == expected_side else invalid_orders).append(order)
             
-            # 撤销不匹配的订单
-            for order in invalid_orders:
-                algo_id = order.get('algoId')
-                logger.warning(f"⚠️ 发现不匹配的止损止盈订单，将撤销: {algo_id}")
-                cancel_specific_algo_order(algo_id)
+            # 撤销不匹配的订单（一次批量请求）
+            if invalid_orders:
+                algo_ids = [order.get('algoId') for order in invalid_orders]
+                logger.warning(f"⚠️ 发现不匹配的止损止盈订单，将撤销: {algo_ids}")
+                cancel_algo_orders(algo_ids)
             
             logger.info(f"📊 止损止盈订单状态: {len(valid_orders)}个有效, {len(invalid_orders)}个无效")
             return True
@@ -1198,10 +1396,9 @@ def safe_close_position(side: str, amount: float):
     
     # 步骤3: 确认平仓后再次检查
     logger.info("步骤3: 确认平仓状态...")
-    time.sleep(3)
-    position_after = get_current_position()
+    position_after = wait_for_position_gone()
     if position_after:
-        logger.error(f"❌ 平仓后仍有持仓: {position_after}")
+        logger.error("❌ 平仓后仍有持仓: %s", position_after)
         return False
     
     # 步骤4: 最终确认无止损止盈订单
@@ -1215,20 +1412,34 @@ def cleanup_after_test():
     try:
         logger.info("🧹 测试结束，执行清理...")
         
-        # 1. 检查并平掉所有持仓
-        position = get_current_position()
+        # 并发查询持仓、止损止盈单和待处理订单
+        positions, algo_response, pending_orders = fetch_account_snapshot()
+        
+        # 1. 检查并平掉所有持仓（safe_close_position 会同时撤销止损止盈订单）
+        position = parse_current_position(positions)
         if position:
-            logger.warning(f"⚠️ 测试结束发现未平持仓: {position}")
+            logger.warning("⚠️ 测试结束发现未平持仓: %s", position)
             logger.info("🔄 自动平仓...")
             safe_close_position(position['side'], position['size'])
         
-        # 2. 撤销所有止损止盈订单
-        logger.info("🔄 撤销所有止损止盈订单...")
-        cancel_all_sl_tp_orders()
+        # 2/3. 撤销止损止盈订单和待处理订单 - 根据查询结果跳过已经干净的部分，需要时并发执行
+        # 条件单查询失败时无法确认状态，仍然执行撤销
+        algo_orders_clean = bool(algo_response) and algo_response.get('code') == '0' and not algo_response.get('data')
+        futures = []
+        if not position and not algo_orders_clean:
+            logger.info("🔄 撤销所有止损止盈订单...")
+            futures.append(io_executor.submit(cancel_all_sl_tp_orders))
+        if pending_orders:
+            logger.info("🔄 取消所有待处理订单...")
+            futures.append(io_executor.submit(cancel_open_orders, pending_orders))
+        if not futures:
+            logger.info("✅ 没有需要撤销的止损止盈订单和待处理订单")
+        for future in futures:
+            future.result()
         
-        # 3. 取消所有待处理订单
-        logger.info("🔄 取消所有待处理订单...")
-        cancel_existing_orders()
+        # 交易对在测试过程中被修改过时，清空按旧交易对缓存的市场信息
+        if config.inst_id != TestConfig.to_inst_id(config.symbol):
+            clear_market_caches()
         
         logger.info("✅ 清理完成")
         return True
@@ -1251,10 +1462,14 @@ def run_enhanced_test():
     logger.info("🧪 先测试最小订单大小...")
     test_minimum_order()
     
+    # 取消现有订单与下面的价格查询、仓位计算互不依赖，放到后台并发执行，开仓前再等待完成
+    cancel_future = io_executor.submit(cancel_existing_orders)
+    
     # 3. 获取当前价格
     current_price = get_current_price()
     if current_price == 0:
         logger.error("❌ 无法获取当前价格，测试中止")
+        cancel_future.result()
         return False
     
     logger.info(f"🎯 测试参数:")
@@ -1265,7 +1480,7 @@ def run_enhanced_test():
     logger.info(f"   等待时间: {config.wait_time_seconds}秒")
     
     # 4. 计算仓位大小
-    position_size = calculate_position_size()
+    position_size = calculate_position_size(current_price)
     
     # 阶段1: 开空单同时设置止损止盈
     logger.info("")
@@ -1275,8 +1490,8 @@ def run_enhanced_test():
     # 计算止损止盈价格
     stop_loss_price, take_profit_price = calculate_stop_loss_take_profit_prices('sell', current_price)
     
-    # 取消现有订单
-    cancel_existing_orders()
+    # 等待取消现有订单完成
+    cancel_future.result()
     
     # 开空单同时设置止损止盈
     short_order_result = create_order_with_sl_tp(
@@ -1315,10 +1530,8 @@ def run_enhanced_test():
     logger.info("🔹 阶段2: 等待10秒后平仓")
     logger.info("-" * 40)
     
-    logger.info(f"⏳ 等待 {config.wait_time_seconds} 秒...")
-    for i in range(config.wait_time_seconds, 0, -1):
-        logger.info(f"   {i}秒后平仓...")
-        time.sleep(1)
+    logger.info(f"⏳ 等待 {config.wait_time_seconds} 秒后平仓...")
+    time.sleep(config.wait_time_seconds)
     
     # 平空单（自动撤销止损止盈）
     logger.info("🔄 执行空单平仓（将自动撤销止损止盈）...")
@@ -1329,8 +1542,7 @@ def run_enhanced_test():
         return False
     
     # 确认持仓已平
-    time.sleep(3)  # 等待系统更新
-    position_after_close = get_current_position()
+    position_after_close = wait_for_position_gone()
     if position_after_close:
         logger.error(f"❌ 持仓未完全平仓，剩余: {position_after_close['size']}张")
         return False
@@ -1342,9 +1554,6 @@ def run_enhanced_test():
     logger.info("🔹 阶段3: 开多单（无止损止盈）")
     logger.info("-" * 40)
     
-    # 获取新的当前价格
-    current_price = get_current_price()
-    
     # 开多单（无止损止盈）
     long_order_result = create_order_without_sl_tp(
         side='buy',
@@ -1384,59 +1593,26 @@ def run_enhanced_test():
     else:
         logger.info("✅ 确认未设置止损止盈，与预期一致")
     
-    # 阶段5: 设置止盈
+    # 阶段5: 一次请求同时设置止盈和止损
     logger.info("")
-    logger.info("🔹 阶段5: 设置止盈(1%距离)")
+    logger.info("🔹 阶段5: 设置止盈止损(OCO)")
     logger.info("-" * 40)
     
-    _, take_profit_price = calculate_stop_loss_take_profit_prices('long', long_position['entry_price'])
+    stop_loss_price, take_profit_price = calculate_stop_loss_take_profit_prices('long', long_position['entry_price'])
     
-    tp_result = set_take_profit_order(
+    sl_tp_result = attach_sl_tp_to_position(
         side='long',
         amount=long_position['size'],
-        trigger_price=take_profit_price
-    )
-    
-    if not tp_result or tp_result.get('code') != '0':
-        logger.error("❌ 止盈设置失败")
-        return False
-    
-    logger.info("✅ 止盈设置成功")
-    
-    # 立即验证止盈设置
-    logger.info("🔍 验证止盈设置...")
-    time.sleep(2)  # 等待系统处理
-    has_tp = check_sl_tp_orders()
-    if not has_tp:
-        logger.error("❌ 止盈设置验证失败 - 未发现止盈订单")
-        return False
-    
-    # 阶段6: 设置止损
-    logger.info("")
-    logger.info("🔹 阶段6: 设置止损(1%距离)")
-    logger.info("-" * 40)
-    
-    stop_loss_price, _ = calculate_stop_loss_take_profit_prices('long', long_position['entry_price'])
-    
-    sl_result = set_stop_loss_order(
-        side='long',
-        amount=long_position['size'],
-        trigger_price=stop_loss_price
+        stop_loss_price=stop_loss_price,
+        take_profit_price=take_profit_price
     )
     
-    if not sl_result or sl_result.get('code') != '0':
-        logger.error("❌ 止损设置失败")
+    if not sl_tp_result or sl_tp_result.get('code') != '0':
+        logger.error("❌ 止盈止损设置失败")
         return False
     
-    logger.info("✅ 止损设置成功")
-    
-    # 立即验证止损设置
-    logger.info("🔍 验证止损设置...")
-    time.sleep(2)  # 等待系统处理
-    has_sl_tp = check_sl_tp_orders()
-    if not has_sl_tp:
-        logger.error("❌ 止损设置验证失败 - 未发现止损止盈订单")
-        return False
+    logger.info("✅ 止盈止损设置成功")
+    time.sleep(2)  # 等待系统处理，止盈止损由下面的最终验证统一检查
     
     # 最终检查
     logger.info("")
@@ -1474,12 +1650,18 @@ def main():
         logger.info(f"   等待时间: {config.wait_time_seconds}秒")
         logger.info(f"   测试模式: {'是' if config.test_mode else '否'}")
         
-        # 用户确认
+        # 用户确认（只有交互式终端才等待输入）
         if not config.test_mode:
             logger.warning("⚠️ 注意: 这不是测试模式，将执行真实交易!")
-            confirm = input("确认继续? (yes/no): ")
-            if confirm.lower() != 'yes':
-                logger.info("测试取消")
+            if config.auto_confirm:
+                logger.info("✅ 已通过 --yes / AUTO_CONFIRM 自动确认")
+            elif sys.stdin.isatty():
+                confirm = input("确认继续? (yes/no): ")
+                if confirm.lower() != 'yes':
+                    logger.info("测试取消")
+                    return
+            else:
+                logger.error("❌ 非交互环境下执行真实交易需要 --yes 或 AUTO_CONFIRM=1，测试取消")
                 return
         
         # 运行测试
@@ -1501,9 +1683,10 @@ def main():
     except Exception as e:
         logger.error(f"💥 测试程序异常: {str(e)}")
         cleanup_after_test()
-        import traceback
         traceback.print_exc()
 
 
 if __name__ == "__main__":
+    if '--yes' in sys.argv[1:]:
+        config.auto_confirm = True
     main()
\ No newline at end of file
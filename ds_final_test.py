@@ -4,14 +4,23 @@
 
 import os
 import time
+import atexit
+import threading
 import sys
 import traceback
 import uuid
 import json
+from dataclasses import dataclass, asdict
 from datetime import datetime
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List, Tuple, Union
 import ccxt
 from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
+
+from okx_common import ExchangeStream, to_inst_id
 
 
 # 在文件顶部定义全局变量
@@ -23,18 +32,46 @@ load_dotenv(dotenv_path=env_path)
 
 # 简单的日志系统
 class TestLogger:
-    def __init__(self, log_dir="../Output/okxSub1", file_name="Enhanced_Test_{timestamp}.log"):
+    FLUSH_INTERVAL = 0.5  # 后台线程刷新日志文件的间隔（秒），与 ds_debug 一致
+
+    def __init__(self, log_dir="../Output/okxSub1", file_name="Enhanced_Test_{timestamp}.log",
+                 debug_enabled: bool = False):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.debug_enabled = debug_enabled  # 关闭时 DEBUG 日志直接丢弃
         self.log_file = f"{log_dir}/{file_name.format(timestamp=timestamp)}"
         os.makedirs(log_dir, exist_ok=True)
+        # 日志文件只打开一次，带缓冲写入；退出时关闭（自动刷新缓冲区）
+        self._fh = open(self.log_file, 'a', encoding='utf-8', buffering=8192)
+        self._lock = threading.Lock()  # 后台线程（线程池、WebSocket）也会写日志
+        self._stop_flush = threading.Event()
+        threading.Thread(target=self._flush_loop, name='test_logger_flush', daemon=True).start()
+        atexit.register(self.close)
+
+    def _flush_loop(self):
+        """定期把缓冲区写入磁盘，进程被杀死时最多丢失 FLUSH_INTERVAL 秒内的日志"""
+        while not self._stop_flush.wait(self.FLUSH_INTERVAL):
+            with self._lock:
+                if self._fh.closed:
+                    return
+                self._fh.flush()
 
     def log(self, level: str, message: str):
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         log_entry = f"{timestamp} - {level} - {message}"
         print(log_entry)
         
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(log_entry + '\n')
+        with self._lock:
+            if self._fh.closed:  # 退出阶段后台线程仍可能写日志
+                return
+            self._fh.write(log_entry + '\n')
+            if level == 'ERROR':
+                self._fh.flush()  # 错误日志立即落盘，异常退出时不丢失
+
+    def close(self):
+        self._stop_flush.set()
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.close()
     
     def info(self, message: str):
         self.log("INFO", message)
@@ -46,7 +83,12 @@ class TestLogger:
         self.log("WARNING", message)
     
     def debug(self, message: str):
-        self.log("DEBUG", message)
+        if self.debug_enabled:
+            self.log("DEBUG", message)
+
+    def is_debug(self) -> bool:
+        """DEBUG 日志是否开启 - 调用方据此跳过昂贵的日志内容构造"""
+        return self.debug_enabled
 
 # 交易配置
 class TestConfig:
@@ -62,31 +104,68 @@ class TestConfig:
         self.price_offset_percent = 0.001
         self.wait_time_seconds = 10
         self.contract_size = 0.01
+        self.inst_id = self.to_inst_id(self.symbol)  # OKX合约ID，只依赖交易对，初始化时计算一次
+
+    # 将CCXT交易对转换为OKX合约ID（与 ds_debug 共用 okx_common 中的实现）
+    to_inst_id = staticmethod(to_inst_id)
+
+# 平仓方向：与持仓/开仓方向相反
+CLOSE_SIDE = {'short': 'buy', 'long': 'sell', 'sell': 'buy', 'buy': 'sell'}
+
+# clOrdId 前缀：区分买卖方向
+CL_ORD_ID_PREFIX = {'sell': 'SELL', 'buy': 'BUY'}
 
 # 账号配置
+@dataclass(frozen=True)
+class AccountConfig:
+    """API凭证 - 导入时从环境变量读取一次，运行中不可修改"""
+    api_key: str
+    secret: str
+    password: str
+
+ACCOUNT = AccountConfig(
+    api_key=os.getenv('OKX_API_KEY_2') or '',
+    secret=os.getenv('OKX_SECRET_2') or '',
+    password=os.getenv('OKX_PASSWORD_2') or '',
+)
+
 def get_account_config(account_name="default"):
-    """根据账号名称获取对应的配置"""
-    return {
-        'api_key': os.getenv('OKX_API_KEY_2'),
-        'secret': os.getenv('OKX_SECRET_2'),
-        'password': os.getenv('OKX_PASSWORD_2')
-    }
+    """根据账号名称获取对应的配置（兼容旧接口，返回 ACCOUNT 的字典形式）"""
+    return asdict(ACCOUNT)
 
 # 初始化交易所
-account_config = get_account_config()
+
+# 复用HTTP连接（keep-alive连接池），避免每次下单/撤单都重新进行TCP+TLS握手
+# 连接池大小覆盖主线程 + io_executor 的并发请求；不自动重试，失败直接交给调用方处理
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+http_session.headers['Connection'] = 'keep-alive'
+
 exchange = ccxt.okx({
     'options': {
         'defaultType': 'swap',
     },
-    'apiKey': account_config['api_key'],
-    'secret': account_config['secret'],
-    'password': account_config['password'],
+    'apiKey': ACCOUNT.api_key,
+    'secret': ACCOUNT.secret,
+    'password': ACCOUNT.password,
+    'session': http_session,
+    'timeout': 5000,  # 毫秒，连接卡住时尽快失败，不拖慢整个测试
 })
 
 config = TestConfig()
 
+# 后台I/O线程池：并发执行互不依赖的交易所请求（共用同一个 exchange 实例和连接）
+io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ds_final_test_io')
+
 # 创建专用logger
-logger = TestLogger(log_dir="../Output/short_sl_tp_test", file_name="Short_SL_TP_Test_{timestamp}.log")
+# 环境变量 TEST_LOG_DEBUG=1 时记录 DEBUG 日志（完整API响应等）
+logger = TestLogger(log_dir="../Output/short_sl_tp_test", file_name="Short_SL_TP_Test_{timestamp}.log",
+                    debug_enabled=os.getenv('TEST_LOG_DEBUG') == '1')
+
+
+# WebSocket 订单/持仓推送订阅（实现见 okx_common，与 ds_debug 共用）
+exchange_stream = ExchangeStream(config, logger, get_account_config, lambda: exchange.markets,
+                                 watch_ticker=False)
 
 
 def log_order_params(order_type: str, params: Dict[str, Any], function_name: str = ""):
@@ -99,45 +178,44 @@ def log_order_params(order_type: str, params: Dict[str, Any], function_name: str
             if key in safe_params:
                 safe_params[key] = '***'
         
-        logger.info(f"📋 {function_name} - {order_type}订单参数:")
-        for key, value in safe_params.items():
-            logger.info(f"   {key}: {value}")
+        lines = [f"📋 {function_name} - {order_type}订单参数:"]
+        lines.extend(f"   {key}: {value}" for key, value in safe_params.items())
+        logger.info("\n".join(lines))
             
     except Exception as e:
         logger.error(f"记录订单参数失败: {str(e)}")
 
+def compact_json(value: Any) -> str:
+    """紧凑JSON：无缩进、无多余空格，保留中文"""
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=str)
+
 def log_api_response(response: Any, function_name: str = ""):
-    """记录API响应到日志"""
+    """记录API响应到日志 - INFO 记录紧凑摘要（data 最多前3条），完整响应只在 DEBUG 开启时记录"""
     try:
-        logger.info(f"📡 {function_name} - API响应:")
         if isinstance(response, dict):
-            for key, value in response.items():
-                if key == 'data' and isinstance(value, list) and len(value) > 0:
-                    logger.info(f"   {key}: [列表，共{len(value)}条记录]")
-                    for i, item in enumerate(value[:3]):
-                        logger.info(f"      [{i}]: {item}")
-                else:
-                    logger.info(f"   {key}: {value}")
+            data = response.get('data')
+            summary = response
+            if isinstance(data, list) and len(data) > 3:
+                summary = {**response, 'data': data[:3]}
+            count = f"（data共{len(data)}条）" if isinstance(data, list) else ""
+            logger.info(f"📡 {function_name} - API响应{count}: {compact_json(summary)}")
+            if summary is not response and logger.is_debug():
+                logger.debug(f"📡 {function_name} - 完整API响应: {compact_json(response)}")
         else:
-            logger.info(f"   响应: {response}")
+            logger.info(f"📡 {function_name} - API响应: {response}")
     except Exception as e:
         logger.error(f"记录API响应失败: {str(e)}")
 
-def get_correct_inst_id():
-    """获取正确的合约ID"""
-    symbol = config.symbol
-    if symbol == 'BTC/USDT:USDT':
-        return 'BTC-USDT-SWAP'
-    elif symbol == 'ETH/USDT:USDT':
-        return 'ETH-USDT-SWAP'
-    else:
-        return symbol.replace('/', '-').replace(':USDT', '-SWAP')
-
 def setup_exchange():
     """设置交易所参数"""
     try:
         logger.info("🔄 设置交易所参数...")
 
+        # 缺少凭证时在测试开始前就失败，而不是等到第一次私有接口调用（导入模块不做校验）
+        if not (ACCOUNT.api_key and ACCOUNT.secret and ACCOUNT.password):
+            logger.error(f"❌ 缺少OKX API凭证，请检查 {env_path} 中的 OKX_API_KEY_2 / OKX_SECRET_2 / OKX_PASSWORD_2")
+            return False
+
         # 先获取市场信息
         market_info = get_lot_size_info()
         min_amount = market_info['min_amount']
@@ -153,6 +231,7 @@ def setup_exchange():
         }
         log_order_params("设置杠杆", leverage_params, "setup_exchange")
         
+        # 同步 ccxt 实例不是线程安全的（限流时间戳、last_http_response 等共享），两个请求依次执行
         exchange.set_leverage(config.leverage, config.symbol)
         logger.info(f"✅ 杠杆设置成功: {config.leverage}x")
         
@@ -161,6 +240,9 @@ def setup_exchange():
         usdt_balance = balance['USDT']['free']
         logger.info(f"💰 USDT余额: {usdt_balance:.2f}")
         
+        # 启动订单/持仓推送订阅（不可用时等待逻辑自动退回 REST 轮询）
+        exchange_stream.start()
+        
         return True
         
     except Exception as e:
@@ -178,11 +260,32 @@ def get_current_price():
         logger.error(f"获取价格失败: {str(e)}")
         return 0
     
+# 按交易对缓存的市场交易量信息 - 市场元数据在一次测试中基本不变，避免每次计算仓位都重新拉取
+LOT_SIZE_INFO_CACHE: Dict[str, Dict[str, Any]] = {}
+
+def invalidate_market_cache():
+    """清空市场信息缓存，下次调用 get_lot_size_info 时重新加载"""
+    LOT_SIZE_INFO_CACHE.clear()
+    exchange.markets = None
+
+def _lot_size_decimals(min_amount, precision) -> Tuple[Decimal, Decimal]:
+    """
+    将最小交易量和数量精度转为 Decimal：(交易步长, 精度量子)
+    如 min_amount=0.01, precision=0.01 → (Decimal('0.01'), Decimal('0.01'))；precision=1.0 → Decimal('1')
+    """
+    # 经 str 转换避免浮点数二进制误差；normalize 去掉尾随0（1.0 → 1）
+    return Decimal(str(min_amount)), Decimal(str(precision)).normalize()
+
 def get_lot_size_info():
-    """获取交易对的最小交易单位信息"""
+    """获取交易对的最小交易单位信息（按交易对缓存）"""
+    symbol = config.symbol
+    cached = LOT_SIZE_INFO_CACHE.get(symbol)
+    if cached is not None:
+        return cached
+    
     try:
-        markets = exchange.load_markets()
-        symbol = config.symbol
+        # load_markets 已加载过时直接复用 exchange.markets
+        markets = exchange.markets or exchange.load_markets()
         
         if symbol in markets:
             market = markets[symbol]
@@ -196,11 +299,16 @@ def get_lot_size_info():
             logger.info(f"   最小交易量: {min_amount}")
             logger.info(f"   数量精度: {precision}")
             
-            return {
+            # 预先计算 Decimal 步长和精度，adjust_position_size 每次调用无需重新转换
+            lot_step, quantum = _lot_size_decimals(min_amount, precision)
+            LOT_SIZE_INFO_CACHE[symbol] = {
                 'min_amount': min_amount,
                 'precision': precision,
+                'lot_step': lot_step,
+                'quantum': quantum,
                 'market_info': market
             }
+            return LOT_SIZE_INFO_CACHE[symbol]
         else:
             logger.warning(f"⚠️ 未找到交易对 {symbol} 的市场信息")
             return {
@@ -231,35 +339,24 @@ def adjust_position_size(amount: float) -> float:
             logger.warning(f"输入数量无效: {amount}，使用最小交易量 {min_amount}")
             return min_amount
         
-        # 计算精度对应的小数位数（如0.01 → 2位小数）
-        # 避免浮点数直接处理，转为字符串解析
-        precision_str = str(precision)
-        if '.' in precision_str:
-            decimal_places = len(precision_str.split('.')[1])
-        else:
-            decimal_places = 0  # 整数精度（如1.0 → 0位小数）
+        # Decimal 步长和精度，缓存中已预先计算
+        lot_step = market_info.get('lot_step')
+        quantum = market_info.get('quantum')
+        if lot_step is None or quantum is None:
+            lot_step, quantum = _lot_size_decimals(min_amount, precision)
         
-        # 1. 先将数量四舍五入到指定精度（避免小数位数过多）
-        rounded_amount = round(amount, decimal_places)
+        # 1. 先将数量四舍五入到指定精度（Decimal 运算，无浮点数误差）
+        rounded_amount = Decimal(str(amount)).quantize(quantum)
         
         # 2. 确保数量不小于最小交易量
-        if rounded_amount < min_amount:
+        if rounded_amount < lot_step:
             logger.warning(f"数量 {rounded_amount} 小于最小交易量 {min_amount}，自动调整为 {min_amount}")
             return min_amount
         
-        # 3. 确保数量是最小交易量的整数倍（核心修复：用整数运算避免浮点数误差）
-        # 转换为最小单位的整数（如0.01 → 1个单位，0.05 → 5个单位）
-        multiplier = 10 **decimal_places  # 10^小数位数（如2 → 100）
-        min_amount_units = int(round(min_amount * multiplier))  # 最小交易量的单位数（如0.01*100=1）
-        amount_units = int(round(rounded_amount * multiplier))   # 当前数量的单位数（如0.05*100=5）
-        
-        # 计算最大的、小于等于当前单位数的最小单位倍数
-        max_valid_units = (amount_units // min_amount_units) * min_amount_units
+        # 3. 向下取整为最小交易量的整数倍
+        adjusted_amount = float((rounded_amount // lot_step) * lot_step)
         
-        # 转换回原始单位
-        adjusted_amount = max_valid_units / multiplier
-        
-        logger.info(f"📏 仓位调整完成: {amount} → {adjusted_amount} (精度: {decimal_places}位小数)")
+        logger.info(f"📏 仓位调整完成: {amount} → {adjusted_amount} (精度: {quantum})")
         return adjusted_amount
         
     except Exception as e:
@@ -325,10 +422,10 @@ def close_position(side: str, amount: float, cancel_sl_tp=True):
     平仓函数 - 增强版本，可选撤销止损止盈
     """
     try:
-        inst_id = get_correct_inst_id()
+        inst_id = config.inst_id
         
         # 平仓方向与开仓方向相反
-        close_side = 'buy' if side == 'short' else 'sell'
+        close_side = CLOSE_SIDE[side]
         
         params = {
             'instId': inst_id,
@@ -351,9 +448,10 @@ def close_position(side: str, amount: float, cancel_sl_tp=True):
             
             # 等待平仓成交
             if wait_for_order_fill(order_id, 30):
-                # 平仓成交后再次确认撤销所有止损止盈
-                logger.info("🔄 平仓成交后确认撤销止损止盈订单...")
-                cancel_all_sl_tp_orders()
+                # 平仓成交后再次确认撤销所有止损止盈（调用方已自行处理时跳过）
+                if cancel_sl_tp:
+                    logger.info("🔄 平仓成交后确认撤销止损止盈订单...")
+                    cancel_all_sl_tp_orders()
                 return response
             else:
                 logger.error(f"❌ 平仓订单未在30秒内成交")
@@ -408,13 +506,24 @@ def get_current_position():
         logger.error(f"获取持仓失败: {str(e)}")
         return None
 
-def analyze_algo_order_type(order):
-    """智能分析条件单类型"""
-    algo_id = order.get('algoId', 'Unknown')
-    
-    # 判断订单类型（通过字段存在性判断）
-    has_tp = order.get('tpTriggerPx') not in [None, '']
-    has_sl = order.get('slTriggerPx') not in [None, '']
+# 条件单详情用到的字段（按此顺序一次取出，缺失时为 'Unknown'）
+ALGO_DETAIL_FIELDS = ('algoId', 'state', 'side', 'posSide', 'sz', 'ordType',
+                      'slTriggerPx', 'slOrdPx', 'tpTriggerPx', 'tpOrdPx', 'triggerPx', 'ordPx')
+
+# 触发价字段视为"未设置"的取值
+EMPTY_TRIGGER_PX = (None, '', 'Unknown')
+
+# 非止盈止损条件单：ordType → 类型名称
+OTHER_ALGO_TYPES = {
+    'move_order_stop': "移动止损",
+    'iceberg': "冰山订单",
+    'twap': "TWAP",
+}
+
+def _classify_algo_order(sl_trigger_px, tp_trigger_px, ord_type) -> str:
+    """根据触发价字段是否存在判断条件单类型"""
+    has_tp = tp_trigger_px not in EMPTY_TRIGGER_PX
+    has_sl = sl_trigger_px not in EMPTY_TRIGGER_PX
     
     if has_tp and has_sl:
         return "OCO"
@@ -422,51 +531,56 @@ def analyze_algo_order_type(order):
         return "止损"
     elif has_tp:
         return "止盈"
-    else:
-        # 进一步检查其他条件单类型
-        ord_type = order.get('ordType', '')
-        if ord_type == 'move_order_stop':
-            return "移动止损"
-        elif ord_type == 'iceberg':
-            return "冰山订单"
-        elif ord_type == 'twap':
-            return "TWAP"
-        else:
-            return "其他条件单"
-
-def _log_algo_order_detail(order):
-    """记录条件单详细信息 - 改进版本"""
-    algo_id = order.get('algoId', 'Unknown')
-    order_type = analyze_algo_order_type(order)
-    state = order.get('state', 'Unknown')
-    side = order.get('side', 'Unknown')
-    pos_side = order.get('posSide', 'Unknown')
-    sz = order.get('sz', 'Unknown')
-    
-    logger.info(f"      ID: {algo_id}")
-    logger.info(f"       类型: {order_type}")
-    logger.info(f"       状态: {state}")
-    logger.info(f"       方向: {side}/{pos_side}")
-    logger.info(f"       数量: {sz}")
+    # 进一步检查其他条件单类型
+    return OTHER_ALGO_TYPES.get(ord_type, "其他条件单")
+
+def analyze_algo_order_type(order):
+    """智能分析条件单类型"""
+    return _classify_algo_order(order.get('slTriggerPx'), order.get('tpTriggerPx'), order.get('ordType', ''))
+
+def _log_algo_order_detail(order, order_type: Optional[str] = None):
+    """记录条件单详细信息 - 字段一次取出；调用方已分类时直接传入 order_type"""
+    (algo_id, state, side, pos_side, sz, ord_type,
+     sl_trigger_px, sl_ord_px, tp_trigger_px, tp_ord_px, trigger_px, ord_px) = [
+        order.get(key, 'Unknown') for key in ALGO_DETAIL_FIELDS]
+    if order_type is None:
+        order_type = _classify_algo_order(sl_trigger_px, tp_trigger_px, ord_type)
+    
+    lines = [
+        f"      ID: {algo_id}",
+        f"       类型: {order_type}",
+        f"       状态: {state}",
+        f"       方向: {side}/{pos_side}",
+        f"       数量: {sz}",
+    ]
     
     # 根据类型显示不同的价格信息
     if order_type == "OCO":
-        logger.info(f"       止损触发: {order.get('slTriggerPx', 'Unknown')}, 委托: {order.get('slOrdPx', 'Unknown')}")
-        logger.info(f"       止盈触发: {order.get('tpTriggerPx', 'Unknown')}, 委托: {order.get('tpOrdPx', 'Unknown')}")
+        lines.append(f"       止损触发: {sl_trigger_px}, 委托: {sl_ord_px}")
+        lines.append(f"       止盈触发: {tp_trigger_px}, 委托: {tp_ord_px}")
     elif order_type == "止损":
-        logger.info(f"       触发价: {order.get('slTriggerPx', 'Unknown')}")
-        logger.info(f"       委托价: {order.get('slOrdPx', 'Unknown')}")
+        lines.append(f"       触发价: {sl_trigger_px}")
+        lines.append(f"       委托价: {sl_ord_px}")
     elif order_type == "止盈":
-        logger.info(f"       触发价: {order.get('tpTriggerPx', 'Unknown')}")
-        logger.info(f"       委托价: {order.get('tpOrdPx', 'Unknown')}")
+        lines.append(f"       触发价: {tp_trigger_px}")
+        lines.append(f"       委托价: {tp_ord_px}")
     else:
-        logger.info(f"       触发价: {order.get('triggerPx', 'Unknown')}")
-        logger.info(f"       委托价: {order.get('ordPx', 'Unknown')}")
+        lines.append(f"       触发价: {trigger_px}")
+        lines.append(f"       委托价: {ord_px}")
+    logger.info("\n".join(lines))
+
+# check_sl_tp_orders 分组显示顺序：(分组, 标题)
+ALGO_ORDER_GROUPS = (
+    ("止损", "🛡️ 止损订单"),
+    ("止盈", "🎯 止盈订单"),
+    ("OCO", "🔄 OCO订单"),
+    ("其他", "❓ 其他条件单"),
+)
 
 def check_sl_tp_orders():
     """检查止损止盈订单状态 - 修复版本，支持OCO和特定品种过滤"""
     try:
-        inst_id = get_correct_inst_id()
+        inst_id = config.inst_id
         
         # 使用条件单查询API来检查止损止盈订单
         params = {
@@ -484,49 +598,18 @@ def check_sl_tp_orders():
             if orders:
                 logger.info(f"✅ 发现止损止盈条件单: {len(orders)}个")
                 
-                # 分类显示订单
-                sl_orders = []
-                tp_orders = [] 
-                oco_orders = []
-                other_orders = []
-                
+                # 分类显示订单 - 一次遍历完成分类，类型只判断一次，记录详情时直接复用
+                groups = {group: [] for group, _ in ALGO_ORDER_GROUPS}
                 for order in orders:
-                    # 判断订单类型（通过字段存在性判断）
-                    has_tp = order.get('tpTriggerPx') not in [None, '']
-                    has_sl = order.get('slTriggerPx') not in [None, '']
-                    
-                    if has_tp and has_sl:
-                        oco_orders.append(order)
-                    elif has_sl:
-                        sl_orders.append(order)
-                    elif has_tp:
-                        tp_orders.append(order)
-                    else:
-                        other_orders.append(order)
+                    order_type = analyze_algo_order_type(order)
+                    groups.get(order_type, groups["其他"]).append((order, order_type))
                 
-                # 显示止损订单
-                if sl_orders:
-                    logger.info(f"   🛡️ 止损订单 ({len(sl_orders)}个):")
-                    for order in sl_orders:
-                        _log_algo_order_detail(order)
-                
-                # 显示止盈订单
-                if tp_orders:
-                    logger.info(f"   🎯 止盈订单 ({len(tp_orders)}个):")
-                    for order in tp_orders:
-                        _log_algo_order_detail(order)
-                
-                # 显示OCO订单
-                if oco_orders:
-                    logger.info(f"   🔄 OCO订单 ({len(oco_orders)}个):")
-                    for order in oco_orders:
-                        _log_algo_order_detail(order)
-                
-                # 显示其他类型订单
-                if other_orders:
-                    logger.info(f"   ❓ 其他条件单 ({len(other_orders)}个):")
-                    for order in other_orders:
-                        _log_algo_order_detail(order)
+                for group, title in ALGO_ORDER_GROUPS:
+                    group_orders = groups[group]
+                    if group_orders:
+                        logger.info(f"   {title} ({len(group_orders)}个):")
+                        for order, order_type in group_orders:
+                            _log_algo_order_detail(order, order_type)
                 
                 return True
             else:
@@ -542,54 +625,71 @@ def check_sl_tp_orders():
         logger.error(f"详细错误信息: {traceback.format_exc()}")
         return False
 
-def cancel_all_sl_tp_orders():
-    """撤销所有止损止盈订单"""
+# OKX 批量撤单接口（cancel-algos / cancel-batch-orders）单次最多20个
+CANCEL_BATCH_SIZE = 20
+
+def list_pending_algo_orders() -> Optional[List[Dict[str, Any]]]:
+    """查询当前交易对所有待处理的止损止盈条件单，查询失败返回 None"""
+    params = {
+        'instType': 'SWAP',
+        'instId': config.inst_id,
+        'ordType': 'conditional,oco',
+    }
+    
     try:
-        inst_id = get_correct_inst_id()
+        response = exchange.private_get_trade_orders_algo_pending(params)
+    except Exception as e:
+        logger.error(f"❌ 获取待撤销订单失败: {str(e)}")
+        return None
+    
+    if response and response.get('code') == '0':
+        return response.get('data', [])
+    logger.error(f"❌ 获取待撤销订单失败: {response}")
+    return None
+
+def cancel_all_sl_tp_orders(orders: Optional[List[Dict[str, Any]]] = None):
+    """
+    撤销所有止损止盈订单
+    :param orders: 已查询到的待处理条件单列表；不传时先查询一次
+    """
+    try:
+        inst_id = config.inst_id
         
         logger.info(f"🔄 撤销 {inst_id} 的所有止损止盈订单...")
         
-        # 获取所有待处理的条件单
-        params = {
-            'instType': 'SWAP',
-            'instId': inst_id,
-            'ordType': 'conditional,oco',
-        }
+        # 获取所有待处理的条件单（调用方已查询过时直接复用）
+        if orders is None:
+            orders = list_pending_algo_orders()
         
-        response = exchange.private_get_trade_orders_algo_pending(params)
-        
-        if response and response.get('code') == '0':
-            orders = response.get('data', [])
-            
+        if orders is not None:
             if not orders:
                 logger.info(f"✅ 没有找到需要撤销的止损止盈订单")
                 return True
             
+            # 批量撤销条件单 - 每批最多20个，一次请求撤销一批
+            cancel_params = [{'algoId': order['algoId'], 'instId': inst_id}
+                             for order in orders if order.get('algoId')]
+            
             cancel_count = 0
-            for order in orders:
-                algo_id = order.get('algoId')
-                if algo_id:
-                    # 撤销单个条件单 - 使用正确的CCXT方法
-                    cancel_params = [
-                        {
-                            'algoId': algo_id,
-                            'instId': inst_id,
-                        }
-                    ]
-                    
-                    # 使用批量撤销条件单的API
-                    cancel_response = exchange.private_post_trade_cancel_algos(cancel_params)
-                    
-                    if cancel_response and cancel_response.get('code') == '0':
-                        logger.info(f"✅ 已撤销条件单: {algo_id}")
-                        cancel_count += 1
-                    else:
-                        logger.error(f"❌ 撤销条件单失败: {algo_id} - {cancel_response}")
+            for i in range(0, len(cancel_params), CANCEL_BATCH_SIZE):
+                batch = cancel_params[i:i + CANCEL_BATCH_SIZE]
+                cancel_response = exchange.private_post_trade_cancel_algos(batch)
+                
+                if cancel_response and cancel_response.get('code') in ('0', '2'):
+                    # code '2' 表示部分成功，逐条检查 sCode
+                    for item in cancel_response.get('data', []):
+                        algo_id = item.get('algoId')
+                        if item.get('sCode', '0') == '0':
+                            logger.info(f"✅ 已撤销条件单: {algo_id}")
+                            cancel_count += 1
+                        else:
+                            logger.error(f"❌ 撤销条件单失败: {algo_id} - {item.get('sMsg')}")
+                else:
+                    logger.error(f"❌ 撤销条件单失败: {[p['algoId'] for p in batch]} - {cancel_response}")
             
             logger.info(f"📊 总计撤销 {cancel_count}/{len(orders)} 个条件单")
             return cancel_count > 0
         else:
-            logger.error(f"❌ 获取待撤销订单失败: {response}")
             return False
             
     except Exception as e:
@@ -608,30 +708,47 @@ def cancel_existing_orders():
         
         if pending_orders:
             for order in pending_orders:
-                order_id = order.get('id')
-                logger.info(f"📋 发现待处理订单: {order_id} - {order.get('side')} {order.get('amount')}")
+                logger.info(f"📋 发现待处理订单: {order.get('id')} - {order.get('side')} {order.get('amount')}")
+            
+            # 批量撤单 - 每批最多20个
+            inst_id = config.inst_id
+            cancel_params = [{'instId': inst_id, 'ordId': order.get('id')} for order in pending_orders]
+            for i in range(0, len(cancel_params), CANCEL_BATCH_SIZE):
+                batch = cancel_params[i:i + CANCEL_BATCH_SIZE]
+                cancel_response = exchange.private_post_trade_cancel_batch_orders(batch)
                 
-                # 取消订单
-                cancel_result = exchange.cancel_order(order_id, config.symbol)
-                if cancel_result:
-                    logger.info(f"✅ 取消订单成功: {order_id}")
+                if cancel_response and cancel_response.get('code') in ('0', '2'):
+                    for item in cancel_response.get('data', []):
+                        order_id = item.get('ordId')
+                        if item.get('sCode', '0') == '0':
+                            logger.info(f"✅ 取消订单成功: {order_id}")
+                        else:
+                            logger.warning(f"⚠️ 取消订单失败: {order_id} - {item.get('sMsg')}")
                 else:
-                    logger.warning(f"⚠️ 取消订单失败: {order_id}")
+                    logger.warning(f"⚠️ 取消订单失败: {[p['ordId'] for p in batch]} - {cancel_response}")
         else:
             logger.info("✅ 没有找到待取消的订单")
                     
     except Exception as e:
         logger.error(f"取消订单失败: {str(e)}")
 
+# REST 轮询退避参数（秒）：首次间隔很短，快速成交时几乎立即发现；之后逐步拉长，慢成交时不增加请求频率
+POLL_MIN_DELAY = 0.1
+POLL_BACKOFF = 1.5
+
 def wait_for_order_fill(order_id: str, timeout: int = 60) -> bool:
-    """等待订单成交"""
+    """等待订单成交 - 优先等待 WebSocket 推送，收不到推送时退回 REST 轮询（指数退避）"""
     logger.info(f"⏳ 等待订单 {order_id} 成交...")
     
     start_time = time.time()
+    delay = POLL_MIN_DELAY
     while time.time() - start_time < timeout:
         try:
-            order = exchange.fetch_order(order_id, config.symbol)
-            status = order['status']
+            # 推送到达即返回；最多等3秒，之后用 REST 确认一次（防止推送丢失）
+            status = exchange_stream.wait(order_id, min(3, timeout - (time.time() - start_time)))
+            if status is None:
+                order = exchange.fetch_order(order_id, config.symbol)
+                status = order['status']
             
             if status == 'closed':
                 logger.info(f"✅ 订单已成交: {order_id}")
@@ -641,27 +758,40 @@ def wait_for_order_fill(order_id: str, timeout: int = 60) -> bool:
                 return False
             else:
                 logger.info(f"📊 订单状态: {status}, 等待中...")
-                
-            time.sleep(3)  # 每3秒检查一次
+            
+            if exchange_stream.watching_orders:
+                continue
             
         except Exception as e:
             logger.error(f"检查订单状态失败: {str(e)}")
-            time.sleep(3)
+        
+        # 无推送或查询失败时退避等待，间隔最长3秒
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, 3.0)
     
     logger.warning(f"⏰ 订单等待超时: {order_id}")
     return False
 
 def wait_for_position(side: str, timeout: int = 30) -> Dict[str, Any]:
-    """等待持仓出现"""
+    """等待持仓出现 - 优先等待 WebSocket 持仓推送，收不到推送时退回 REST 轮询（指数退避）"""
     logger.info(f"⏳ 等待{side}持仓出现...")
     
     start_time = time.time()
+    delay = POLL_MIN_DELAY
     while time.time() - start_time < timeout:
-        position = get_current_position()
+        # 推送到达即返回；最多等2秒，之后用 REST 确认一次
+        matched, position = exchange_stream.wait_position(
+            lambda p: p is not None and p['side'] == side,
+            min(2, timeout - (time.time() - start_time)))
+        if not matched:
+            position = get_current_position()
         if position and position['side'] == side:
             logger.info(f"✅ {side}持仓已建立")
             return position
-        time.sleep(2)  # 每2秒检查一次
+        if not exchange_stream.watching_positions:
+            # 无推送时退避等待，间隔最长2秒
+            time.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, 2.0)
     
     logger.error(f"❌ {side}持仓未在{timeout}秒内出现")
     return None
@@ -669,6 +799,8 @@ def wait_for_position(side: str, timeout: int = 30) -> Dict[str, Any]:
 def safe_close_position(side: str, amount: float):
     """
     安全平仓函数 - 确保平仓后止损止盈被撤销
+    返回 True 表示平仓成功，且步骤4的查询确认没有残留的止损止盈订单；
+    查询失败或发现残留（即使已尝试撤销）都返回 False，调用方需要自行再撤销一次
     """
     logger.info(f"🔒 安全平仓: {side} {amount}张")
     
@@ -676,7 +808,7 @@ def safe_close_position(side: str, amount: float):
     logger.info("步骤1: 撤销止损止盈订单...")
     cancel_all_sl_tp_orders()
     
-    # 步骤2: 执行平仓
+    # 步骤2: 执行平仓（不在平仓后再撤销，由步骤4统一确认）
     logger.info("步骤2: 执行平仓...")
     close_result = close_position(side, amount, cancel_sl_tp=False)  # 这里设为False因为我们已经撤销过了
     
@@ -688,9 +820,16 @@ def safe_close_position(side: str, amount: float):
         logger.error(f"❌ 平仓后仍有持仓: {position_after}")
         return False
     
-    # 步骤4: 最终确认无止损止盈订单
+    # 步骤4: 最终确认无止损止盈订单 - 只查询一次，确有残留时才撤销
     logger.info("步骤4: 最终确认无止损止盈订单...")
-    cancel_all_sl_tp_orders()
+    remaining_orders = list_pending_algo_orders()
+    if remaining_orders:
+        cancel_all_sl_tp_orders(orders=remaining_orders)
+        return False
+    if remaining_orders is None:
+        logger.warning("⚠️ 无法确认止损止盈订单是否已全部撤销")
+        return False
+    logger.info("✅ 没有残留的止损止盈订单")
     
     return close_result is not None
 
@@ -701,18 +840,20 @@ def cleanup_after_test():
         
         # 1. 检查并平掉所有持仓
         position = get_current_position()
+        sl_tp_cleared = False
         if position:
             logger.warning(f"⚠️ 测试结束发现未平持仓: {position}")
             logger.info("🔄 自动平仓...")
-            safe_close_position(position['side'], position['size'])
-        
-        # 2. 撤销所有止损止盈订单
-        logger.info("🔄 撤销所有止损止盈订单...")
-        cancel_all_sl_tp_orders()
+            # 返回 True 时步骤4已查询确认无残留止损止盈订单，无需再撤销一次
+            sl_tp_cleared = safe_close_position(position['side'], position['size'])
         
-        # 3. 取消所有待处理订单
-        logger.info("🔄 取消所有待处理订单...")
-        cancel_existing_orders()
+        # 2/3. 撤销所有止损止盈订单和待处理订单 - 两者互不依赖，并发执行
+        logger.info("🔄 撤销所有止损止盈订单和待处理订单...")
+        sl_tp_future = None if sl_tp_cleared else io_executor.submit(cancel_all_sl_tp_orders)
+        orders_future = io_executor.submit(cancel_existing_orders)
+        if sl_tp_future is not None:
+            sl_tp_future.result()
+        orders_future.result()
         
         logger.info("✅ 清理完成")
         return True
@@ -732,9 +873,8 @@ def generate_cl_ord_id(side: str) -> str:
     - 长度 1-32位
     - 前缀区分买卖方向，确保唯一性
     """
-    prefix = "SELL" if side == "sell" else "BUY"
-    unique_str = str(uuid.uuid4()).replace('-', '')
-    cl_ord_id = f"{prefix}{unique_str}"[:32]
+    prefix = CL_ORD_ID_PREFIX.get(side, "BUY")
+    cl_ord_id = f"{prefix}{uuid.uuid4().hex}"[:32]
     return cl_ord_id
 
 def verify_position_closed(timeout: int = 10) -> bool:
@@ -742,6 +882,7 @@ def verify_position_closed(timeout: int = 10) -> bool:
     logger.info("🔍 验证仓位是否已平...")
     
     start_time = time.time()
+    delay = POLL_MIN_DELAY
     while time.time() - start_time < timeout:
         position = get_current_position()
         
@@ -751,13 +892,14 @@ def verify_position_closed(timeout: int = 10) -> bool:
             return True
         
         # 检查是否是目标交易对的持仓
-        inst_id = get_correct_inst_id()
+        inst_id = config.inst_id
         if position.get('symbol') != inst_id and position.get('instrument') != inst_id:
             logger.info(f"✅ 目标交易对 {inst_id} 无持仓，其他持仓: {position.get('symbol')}")
             return True
             
         logger.info(f"⏳ 仍有持仓: {position}, 等待中...")
-        time.sleep(2)
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, 2.0)  # 指数退避，间隔最长2秒
     
     logger.error("❌ 仓位未在指定时间内平掉")
     return False
@@ -792,13 +934,16 @@ def algo_order_pending_get_comprehensive_info(inst_id: str) -> Dict[str, Any]:
             "ordType": "conditional,oco"  # 策略订单类型，可根据需要扩展
         }
         
-        logger.info(f"🔍 查询策略委托单（未完成）请求参数: {json.dumps(params, indent=2)}")
+        logger.info(f"🔍 查询策略委托单（未完成）请求参数: {compact_json(params)}")
         
         # 调用 OKX 未完成算法订单查询接口
         response = exchange.private_get_trade_orders_algo_pending(params)
         
-        # 打印完整响应日志
-        logger.info(f"📥 策略委托单查询响应: {json.dumps(response, indent=2)}")
+        # INFO 只记录摘要；完整响应（订单多时体积很大）仅在 DEBUG 开启时序列化
+        if response:
+            logger.info(f"📥 策略委托单 {inst_id}: code={response.get('code')} count={len(response.get('data') or [])}")
+            if logger.is_debug():
+                logger.debug(f"📥 策略委托单查询响应: {compact_json(response)}")
         
         # 检查接口返回状态
         if not response:
@@ -830,6 +975,9 @@ def algo_order_pending_get_comprehensive_info(inst_id: str) -> Dict[str, Any]:
     return result
 
 #未完成的委托订单解析
+# 订单方向 → 中文名称
+SIDE_NAMES = {'buy': "多", 'sell': "空"}
+
 def algo_pending_orders_parse(
     algo_result: Dict[str, Any],
     target_inst_id: Optional[str] = None
@@ -861,43 +1009,30 @@ def algo_pending_orders_parse(
         logger.info("=" * 80)
         return
 
-    # 筛选目标交易对的订单（如果指定）
-    filtered_orders = []
+    # 一次遍历：筛选目标交易对（如果指定）的同时解析并打印订单信息
+    idx = 0
     for order in algo_orders:
-        order_inst_id = order.get("instId")
-        if not target_inst_id or order_inst_id == target_inst_id:
-            filtered_orders.append(order)
-
-    logger.info(f"🔍 筛选后有效订单数量：{len(filtered_orders)} 条")
+        order_inst_id = order.get("instId", "未知")
+        if target_inst_id and order_inst_id != target_inst_id:
+            continue
+        idx += 1
+
+        # 格式化打印（突出显示止盈止损信息）- 每个订单一次写入；字段兼容OKX接口返回格式
+        logger.info("\n".join((
+            f"📌 订单 #{idx}",
+            f"   交易对：{order_inst_id} | 类型：{order.get('ordType', '未知')} | "  # conditional=条件单, oco=OCO单等
+            f"方向：{SIDE_NAMES.get(order.get('side'), '未知')}",
+            f"   策略ID：{order.get('algoId', '未知')} | 自定义ID：{order.get('algoClOrdId', '未设置')}",
+            f"   数量：{order.get('sz', '未知')} | 状态：{order.get('state', '未知')}",
+            f"   🛡️ 止损触发价：{order.get('slTriggerPx', '未设置')}",  # 重点标注止损
+            f"   🎯 止盈触发价：{order.get('tpTriggerPx', '未设置')}",  # 重点标注止盈
+            f"   关联主订单：{order.get('attachOrdId', '无关联')}",
+            "-" * 60,
+        )))
+
+    logger.info(f"🔍 筛选后有效订单数量：{idx} 条")
     logger.info("-" * 80)
 
-    # 逐个解析并打印订单信息
-    for idx, order in enumerate(filtered_orders, 1):
-        # 提取核心字段（兼容OKX接口返回格式）
-        order_info = {
-            "序号": idx,
-            "交易对": order.get("instId", "未知"),
-            "策略订单ID": order.get("algoId", "未知"),
-            "自定义策略ID": order.get("algoClOrdId", "未设置"),
-            "订单类型": order.get("ordType", "未知"),  # conditional=条件单, oco=OCO单等
-            "方向": "多" if order.get("side") == "buy" else "空" if order.get("side") == "sell" else "未知",
-            "数量": order.get("sz", "未知"),
-            "状态": order.get("state", "未知"),
-            "止损触发价": order.get("slTriggerPx", "未设置"),
-            "止盈触发价": order.get("tpTriggerPx", "未设置"),
-            "关联主订单ID": order.get("attachOrdId", "无关联")
-        }
-
-        # 格式化打印（突出显示止盈止损信息）
-        logger.info(f"📌 订单 #{order_info['序号']}")
-        logger.info(f"   交易对：{order_info['交易对']} | 类型：{order_info['订单类型']} | 方向：{order_info['方向']}")
-        logger.info(f"   策略ID：{order_info['策略订单ID']} | 自定义ID：{order_info['自定义策略ID']}")
-        logger.info(f"   数量：{order_info['数量']} | 状态：{order_info['状态']}")
-        logger.info(f"   🛡️ 止损触发价：{order_info['止损触发价']}")  # 重点标注止损
-        logger.info(f"   🎯 止盈触发价：{order_info['止盈触发价']}")  # 重点标注止盈
-        logger.info(f"   关联主订单：{order_info['关联主订单ID']}")
-        logger.info("-" * 60)
-
 def get_pending_algo_order_count(
     algo_result: Dict[str, Any],
     target_inst_id: Optional[str] = None
@@ -942,11 +1077,11 @@ def close_position_universal(
     """
     try:
         # 1. 确定平仓方向（与原持仓方向相反）
-        close_side = 'sell' if side in ('buy', 'long') else 'buy'
+        close_side = CLOSE_SIDE[side]
         action_name = f"{'多头' if side in ('buy', 'long') else '空头'}{'市价' if ord_type == 'market' else '限价'}平仓"
         
         # 2. 获取必要参数
-        inst_id = get_correct_inst_id()
+        inst_id = config.inst_id
         current_price = get_current_price()
         
         if current_price == 0:
@@ -1159,7 +1294,7 @@ def amend_traded_sl_tp(
         return result
     
     # 补全交易对ID
-    inst_id = inst_id or get_correct_inst_id()
+    inst_id = inst_id or config.inst_id
     if not inst_id:
         result["error"] = "无法获取交易对ID（inst_id）"
         logger.error(result["error"])
@@ -1251,7 +1386,7 @@ def cancel_attached_sl_tp_by_algo_ids(main_ord_id: str, attach_algo_ids: List[st
         logger.info("✅ 没有需要撤销的附带止盈止损单")
         return True
         
-    inst_id = get_correct_inst_id()
+    inst_id = config.inst_id
     success = True
     
     logger.info(f"🔧 开始撤销附带止盈止损单, 主订单状态: {main_order_state}, 止盈止损激活状态: {has_activated_sl_tp}")
@@ -1332,7 +1467,7 @@ def create_order_with_sl_tp(
             }
     """
     try:
-        inst_id = get_correct_inst_id()  # 假设已实现获取标的ID的函数
+        inst_id = config.inst_id
         order_type_name = "市价单" if order_type == 'market' else "限价单"
         
         # 1. 生成主订单的自定义ID（clOrdId）
@@ -1446,7 +1581,7 @@ def sl_tp_algo_order_set(side: str, amount: float, stop_loss_price: Optional[flo
         return result
 
     try:
-        inst_id = get_correct_inst_id()
+        inst_id = config.inst_id
         opposite_side = 'buy' if side in ('sell', 'short') else 'sell'
         
         # 公共参数（三种订单类型的共有字段）
@@ -1569,7 +1704,7 @@ def get_algo_order_info_by_clId(
     
     try:
         # 补全交易对ID
-        inst_id = inst_id or get_correct_inst_id()
+        inst_id = inst_id or config.inst_id
         if not inst_id:
             result["error"] = "无法获取交易对ID"
             logger.error(result["error"])
@@ -1658,9 +1793,9 @@ def confirm_algo_order_by_clId(
         return result
     
     # 计算预期的平仓方向（与开仓方向相反）
-    close_side = "buy" if side == "short" else "sell"
+    close_side = CLOSE_SIDE[side]
     expected_sz = str(amount)  # 数量需转为字符串（与API参数一致）
-    inst_id = get_correct_inst_id()
+    inst_id = config.inst_id
     if not inst_id:
         result["error"] = "无法获取交易对ID"
         logger.error(result["error"])
@@ -1841,7 +1976,7 @@ def run_short_sl_tp_test():
         algo_cl_ord_id = saved_attach_algo_cl_ord_id
         logger.info(f"🔧 进行止盈止损撤销操作")
         # 其次尝试使用我们自定义的ID
-        if cancel_algo_order_by_attach_id(algo_cl_ord_id, get_correct_inst_id()):
+        if cancel_algo_order_by_attach_id(algo_cl_ord_id, config.inst_id):
             success = True
     else:
         logger.info("🔧 未发现需要撤销的止盈止损单")
@@ -1854,7 +1989,7 @@ def run_short_sl_tp_test():
     # 确认止盈止损单已取消
     time.sleep(5)
     
-    inst_id = get_correct_inst_id()
+    inst_id = config.inst_id
     if Is_sl_tp_canceled_with_instId(inst_id):
         logger.info("✅ 确认所有止盈止损单已取消")
     else:
@@ -6,8 +6,12 @@ import hashlib
 import sys
 import math
 import uuid
-from functools import wraps
+import threading
+from collections import OrderedDict
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List, Tuple, Any, Union
+from dataclasses import dataclass
 import schedule
 from openai import OpenAI
 import ccxt
@@ -16,10 +20,14 @@ import numpy as np
 import re
 from dotenv import load_dotenv
 import json
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
-#导入配置中心 (必须在导入 trade_logger之前，但因为 config_center.py 是自初始化的，顺序不严格)
-from cmd_config import CURRENT_ACCOUNT
+#导入配置中心 (账户名在首次调用 get_current_account() 时惰性解析，导入顺序不严格)
+from cmd_config import get_current_account
+CURRENT_ACCOUNT = get_current_account()
 
 # Trading parameter configuration - combining advantages of both versions
 from trade_config import (TradingConfig, 
@@ -47,6 +55,26 @@ position = None
 SCALING_HISTORY: Dict[str, Dict] = {}
 # 添加全局变量来存储持仓历史
 POSITION_HISTORY: Dict[str, List[Dict]] = {}
+# 情绪数据缓存: (symbol, 15分钟桶序号) -> (缓存时间, 情绪数据)
+SENTIMENT_CACHE: Dict[Tuple[str, int], Tuple[float, Optional[Dict]]] = {}
+SENTIMENT_BUCKET_SECONDS = 900  # 情绪API按15分钟聚合
+SENTIMENT_CACHE_TTL = 60        # 同一桶内缓存有效期（秒）
+# DeepSeek信号缓存: (symbol, 当前K线开盘时间) -> 信号数据，同一根K线内重复分析直接复用
+SIGNAL_CACHE: 'OrderedDict[Tuple[Any, ...], Dict]' = OrderedDict()
+SIGNAL_CACHE_MAX_SIZE = 256
+# DeepSeek回复缓存: 提示词哈希 -> (缓存时间, 原始回复)，行情平淡时相同输入直接复用回复
+LLM_REPLY_CACHE: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+LLM_REPLY_CACHE_MAX_SIZE = 256
+LLM_REPLY_CACHE_TTL = 300  # 5分钟
+
+# 预编译的正则表达式（JSON修复和DeepSeek回复清理）
+RE_UNQUOTED_KEY = re.compile(r'(\w+):')
+RE_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+RE_NUM_COMMA = re.compile(r'(\d),(\d)')
+RE_QUOTED_AFTER_NUM = re.compile(r'(\d+)-"(\w+)"')
+RE_QUOTED_BEFORE_NUM = re.compile(r'"(\w+)"-(\d+)')
+# 单引号 -> 双引号 的字符映射表
+JSON_QUOTE_TABLE = str.maketrans("'", '"')
 
 # Use relative path
 env_path = '../ExApiConfig/ExApiConfig.env'  # .env file in config folder of parent directory
@@ -54,7 +82,23 @@ logger.log_info(f"📁Add config file: {env_path}")
 load_dotenv(dotenv_path=env_path)
 
 # Initialize DeepSeek client with error handling
-deepseek_client = None
+# 按 (base_url, api_key) 缓存客户端，不同账户/配置使用各自的客户端
+deepseek_clients: Dict[Tuple[str, str], OpenAI] = {}
+deepseek_client_lock = threading.Lock()
+
+# 情绪API的持久化HTTP会话（复用TCP+TLS连接）
+sentiment_session = None
+sentiment_session_lock = threading.Lock()
+
+# 后台I/O线程池：用于在构建提示词的同时并发获取情绪数据等网络请求
+io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ds_io')
+
+# 后台预取K线专用的交易所实例（只拉取公开行情），不与主线程下单共用同一个同步 ccxt 实例
+prefetch_exchange = None
+prefetch_exchange_lock = threading.Lock()
+
+# 预取数据的最大可用时长（秒）：超过后在仓位计算/止盈止损之前刷新最新价格
+PREFETCH_MAX_AGE = 5
 
 # 在文件顶部添加这些函数
 def get_timeframe_seconds(timeframe: str) -> int:
@@ -144,36 +188,73 @@ def log_scheduling_status():
             logger.log_info(f"  {schedule['symbol']}: {time_str} ({schedule['timeframe']})")
 
 def get_deepseek_client(symbol: str):
-    global deepseek_client
+    """获取DeepSeek客户端（双重检查加锁，多线程下只初始化一次）"""
     config = SYMBOL_CONFIGS[symbol]
-    if deepseek_client is None:
-        try:
-            api_key = os.getenv('DEEPSEEK_API_KEY')
-            if not api_key:
-                raise ValueError("DEEPSEEK_API_KEY environment variable is not set")
-            
-            deepseek_client = OpenAI(
-                api_key=api_key,
-                base_url=config.deepseek_base_url
-            )
-            logger.log_info("DeepSeek client initialized successfully")
-        except Exception as e:
-            logger.log_error("deepseek_client_init", str(e))
-            raise
-    return deepseek_client
+    api_key = os.getenv('DEEPSEEK_API_KEY')
+    client_key = (config.deepseek_base_url, api_key)
+    client = deepseek_clients.get(client_key)
+    if client is None:
+        with deepseek_client_lock:
+            client = deepseek_clients.get(client_key)
+            if client is None:
+                try:
+                    if not api_key:
+                        raise ValueError("DEEPSEEK_API_KEY environment variable is not set")
 
+                    client = OpenAI(
+                        api_key=api_key,
+                        base_url=config.deepseek_base_url
+                    )
+                    deepseek_clients[client_key] = client
+                    logger.log_info("DeepSeek client initialized successfully")
+                except Exception as e:
+                    logger.log_error("deepseek_client_init", str(e))
+                    raise
+    return client
+
+def get_sentiment_session(symbol: str) -> requests.Session:
+    """获取情绪API的持久化会话（首次调用时初始化，之后复用keep-alive连接）"""
+    global sentiment_session
+    if sentiment_session is None:
+        # 后台线程池可能并发调用，双重检查加锁避免重复创建连接池
+        with sentiment_session_lock:
+            if sentiment_session is None:
+                config = SYMBOL_CONFIGS[symbol]
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=8,
+                    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504))
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "X-API-KEY": config.sentiment_api_key,
+                    "Connection": "keep-alive"
+                })
+                sentiment_session = session
+    return sentiment_session
+
+@lru_cache(maxsize=64)
 def get_base_currency(symbol: str) -> str:
     """
     将完整的交易品种名称（例如 'BTC/USDT:USDT'）转换为基础货币简称（例如 'BTC'）。
+    品种数量很少且固定，结果缓存（日志等热路径上大量调用）。
     """
     try:
         # 使用 '/' 分割字符串，并取第一个部分
-        base_currency = symbol.split('/')[0]
+        base_currency = symbol.split('/', 1)[0]
         return base_currency
     except Exception:
         # 如果分割失败（例如输入不包含 '/'），则返回原始字符串
         return symbol
 
+@lru_cache(maxsize=64)
+def get_sentiment_token(symbol: str) -> str:
+    """情绪API使用的币种代码（大写基础货币，例如 'BTC/USDT:USDT' -> 'BTC'）"""
+    return get_base_currency(symbol).upper()
+
 # 根据账号选择对应的环境变量
 def get_account_config(account_name):
     """根据账号名称获取对应的配置"""
@@ -216,6 +297,22 @@ exchange = ccxt.okx({
     'password': account_config['password'],
 })
 
+def get_prefetch_exchange():
+    """获取后台预取专用的交易所实例（首次调用时创建，复用主实例已加载的市场信息）"""
+    global prefetch_exchange
+    if prefetch_exchange is None:
+        with prefetch_exchange_lock:
+            if prefetch_exchange is None:
+                ex = ccxt.okx({
+                    'options': {
+                        'defaultType': 'swap',
+                    },
+                })
+                if exchange.markets:
+                    ex.set_markets(exchange.markets)
+                prefetch_exchange = ex
+    return prefetch_exchange
+
 # 1. 根据当前账号选择要交易的品种列表
 symbols_to_trade_raw = ACCOUNT_SYMBOL_MAPPING.get(CURRENT_ACCOUNT, [])
 # 2. 从 MULTI_SYMBOL_CONFIGS 中过滤并初始化 SYMBOL_CONFIGS
@@ -595,17 +692,29 @@ def cleanup_resources():
                 logger.log_warning(f"⚠️ 交易所连接清理异常: {str(e)}")
         
         # 3. 清理 DeepSeek 客户端
-        global deepseek_client
-        if deepseek_client:
-            deepseek_client = None
+        if deepseek_clients:
+            deepseek_clients.clear()
             logger.log_info("✅ DeepSeek 客户端已清理")
-        
+
+        # 清理情绪API会话
+        global sentiment_session
+        if sentiment_session:
+            sentiment_session.close()
+            sentiment_session = None
+            logger.log_info("✅ 情绪API会话已关闭")
+
+        # 关闭后台I/O线程池
+        io_executor.shutdown(wait=False)
+
         # 4. 清理全局变量
         global price_history, signal_history, SCALING_HISTORY, POSITION_HISTORY
         price_history.clear()
         signal_history.clear()
         SCALING_HISTORY.clear()
         POSITION_HISTORY.clear()
+        SENTIMENT_CACHE.clear()
+        SIGNAL_CACHE.clear()
+        LLM_REPLY_CACHE.clear()
         
         logger.log_info("✅ 所有资源清理完成")
         
@@ -1204,8 +1313,9 @@ def setup_exchange(symbol: str):
         logger.log_error(f"exchange_setup_{get_base_currency(symbol)}", str(e))
         return False
 
-def fetch_extended_ohlcv(symbol: str, hours: int = 24):
-    """获取扩展的K线数据以覆盖指定小时数"""
+def fetch_extended_ohlcv(symbol: str, hours: int = 24, ex=None):
+    """获取扩展的K线数据以覆盖指定小时数（ex: 可选的交易所实例，默认使用全局 exchange）"""
+    ex = ex or exchange
     config = SYMBOL_CONFIGS[symbol]
     try:
         # 根据时间帧计算所需K线数量
@@ -1222,11 +1332,11 @@ def fetch_extended_ohlcv(symbol: str, hours: int = 24):
         
         logger.log_info(f"📊 {get_base_currency(symbol)}: 获取{hours}小时数据，需要{actual_limit}根{config.timeframe}K线")
         
-        ohlcv = exchange.fetch_ohlcv(symbol, config.timeframe, limit=actual_limit)
+        ohlcv = ex.fetch_ohlcv(symbol, config.timeframe, limit=actual_limit)
         
         if ohlcv is None or len(ohlcv) < 50:  # 至少需要50根K线
             logger.log_warning(f"⚠️ {get_base_currency(symbol)}: 扩展数据获取不足，使用默认数据")
-            return fetch_ohlcv_with_retry(symbol)
+            return fetch_ohlcv_with_retry(symbol, ex=ex)
             
         df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
@@ -1238,7 +1348,7 @@ def fetch_extended_ohlcv(symbol: str, hours: int = 24):
     except Exception as e:
         logger.log_error(f"extended_ohlcv_{get_base_currency(symbol)}", str(e))
         # 降级到原函数
-        return fetch_ohlcv_with_retry(symbol)
+        return fetch_ohlcv_with_retry(symbol, ex=ex)
 
 def calculate_multi_timeframe_support_resistance(df, lookback_periods=[20, 50, 100]):
     """基于多个时间范围计算支撑阻力位"""
@@ -1306,7 +1416,8 @@ def identify_trend_strength(df):
         trend_scores = {}
         for tf_name, period in timeframes.items():
             if len(df) >= period:
-                sma = df['close'].rolling(period).mean().iloc[-1]
+                # 只需要最新一期的均线值，无需计算整条滚动序列
+                sma = df['close'].iloc[-period:].mean()
                 # 价格在均线上方为正值，下方为负值
                 trend_scores[tf_name] = (current_price - sma) / sma * 100
         
@@ -1649,47 +1760,52 @@ def calculate_intelligent_position(symbol: str, signal_data: dict, price_data: d
 def calculate_technical_indicators(df):
     """Calculate technical indicators - from first strategy"""
     try:
+        close = df['close']
+        high = df['high']
+        low = df['low']
+
         # Moving averages
-        df['sma_5'] = df['close'].rolling(window=5, min_periods=1).mean()
-        df['sma_20'] = df['close'].rolling(window=20, min_periods=1).mean()
-        df['sma_50'] = df['close'].rolling(window=50, min_periods=1).mean()
+        df['sma_5'] = close.rolling(window=5, min_periods=1).mean()
+        df['sma_20'] = close.rolling(window=20, min_periods=1).mean()
+        df['sma_50'] = close.rolling(window=50, min_periods=1).mean()
 
         # Exponential moving averages
-        df['ema_12'] = df['close'].ewm(span=12).mean()
-        df['ema_26'] = df['close'].ewm(span=26).mean()
+        df['ema_12'] = close.ewm(span=12).mean()
+        df['ema_26'] = close.ewm(span=26).mean()
         df['macd'] = df['ema_12'] - df['ema_26']
         df['macd_signal'] = df['macd'].ewm(span=9).mean()
         df['macd_histogram'] = df['macd'] - df['macd_signal']
 
         # Relative Strength Index (RSI)
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+        delta = close.diff().fillna(0)
+        gain = delta.clip(lower=0).rolling(14).mean()
+        loss = (-delta).clip(lower=0).rolling(14).mean()
         rs = gain / loss
         df['rsi'] = 100 - (100 / (1 + rs))
 
-        # Bollinger Bands
-        df['bb_middle'] = df['close'].rolling(20).mean()
-        bb_std = df['close'].rolling(20).std()
+        # Bollinger Bands (共用同一个20期滚动窗口)
+        window_20 = close.rolling(20)
+        df['bb_middle'] = window_20.mean()
+        bb_std = window_20.std()
         df['bb_upper'] = df['bb_middle'] + (bb_std * 2)
         df['bb_lower'] = df['bb_middle'] - (bb_std * 2)
-        df['bb_position'] = (df['close'] - df['bb_lower']) / (df['bb_upper'] - df['bb_lower'])
+        df['bb_position'] = (close - df['bb_lower']) / (df['bb_upper'] - df['bb_lower'])
 
         # Volume moving average
         df['volume_ma'] = df['volume'].rolling(20).mean()
         df['volume_ratio'] = df['volume'] / df['volume_ma']
 
         # Support resistance levels
-        df['resistance'] = df['high'].rolling(20).max()
-        df['support'] = df['low'].rolling(20).min()
+        df['resistance'] = high.rolling(20).max()
+        df['support'] = low.rolling(20).min()
 
-        # 添加ATR计算
-        high_low = df['high'] - df['low']
-        high_close = np.abs(df['high'] - df['close'].shift())
-        low_close = np.abs(df['low'] - df['close'].shift())
-        
-        ranges = pd.concat([high_low, high_close, low_close], axis=1)
-        true_range = np.max(ranges, axis=1)
+        # 添加ATR计算 (逐元素取最大值，忽略首行的 NaN)
+        prev_close = close.shift()
+        high_low = high - low
+        high_close = (high - prev_close).abs()
+        low_close = (low - prev_close).abs()
+
+        true_range = np.fmax(high_low, np.fmax(high_close, low_close))
         df['atr'] = true_range.rolling(14).mean()
 
         # Fill NaN values
@@ -1728,79 +1844,172 @@ def get_support_resistance_levels(df, lookback=20):
         return {}
 
 
+def cache_sentiment_result(symbol: str, bucket: int, result: Optional[Dict]):
+    """写入情绪数据缓存，并清理过期的时间桶"""
+    global SENTIMENT_CACHE
+    SENTIMENT_CACHE[(symbol, bucket)] = (time.time(), result)
+    SENTIMENT_CACHE = {k: v for k, v in SENTIMENT_CACHE.items() if k[1] >= bucket - 2}
+
+
+def build_sentiment_request(api_key: str, tokens: List[str]) -> Dict[str, Any]:
+    """构建情绪API请求体（最近4小时、15分钟粒度）"""
+    # Get recent 4-hour data
+    end_time = datetime.now()
+    start_time = end_time - timedelta(hours=4)
+
+    return {
+        "apiKey": api_key,
+        "endpoints": ["CO-A-02-01", "CO-A-02-02"],  # Keep only core indicators
+        "startTime": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "endTime": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "timeType": "15m",
+        "token": tokens
+    }
+
+
+def parse_sentiment_time(s: str) -> datetime:
+    """解析固定格式 'YYYY-MM-DD HH:MM:SS' 的时间（比 strptime 快得多）"""
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                    int(s[11:13]), int(s[14:16]), int(s[17:19]))
+
+
+def parse_sentiment_periods(symbol: str, time_periods: List[Dict]) -> Optional[Dict]:
+    """从情绪API返回的时间段列表中提取第一个有效的情绪数据"""
+    now = datetime.now()
+
+    # Find first time period with valid data
+    for period in time_periods:
+        period_data = period.get("data", [])
+
+        sentiment = {}
+        valid_data_found = False
+
+        for item in period_data:
+            endpoint = item.get("endpoint")
+            value = item.get("value", "").strip()
+
+            if value:  # Only process non-empty values
+                try:
+                    if endpoint in ["CO-A-02-01", "CO-A-02-02"]:
+                        sentiment[endpoint] = float(value)
+                        valid_data_found = True
+                except (ValueError, TypeError):
+                    continue
+
+        # If valid data found
+        if valid_data_found and "CO-A-02-01" in sentiment and "CO-A-02-02" in sentiment:
+            positive = sentiment['CO-A-02-01']
+            negative = sentiment['CO-A-02-02']
+            net_sentiment = positive - negative
+
+            # Correct time delay calculation
+            data_delay = int((now - parse_sentiment_time(period['startTime'])).total_seconds()) // 60
+
+            logger.log_warning(f"✅ {get_base_currency(symbol)}: 使用情绪数据时间: {period['startTime']} (延迟: {data_delay} 分钟)")
+
+            return {
+                'positive_ratio': positive,
+                'negative_ratio': negative,
+                'net_sentiment': net_sentiment,
+                'data_time': period['startTime'],
+                'data_delay_minutes': data_delay
+            }
+
+    logger.log_warning(f"❌ {get_base_currency(symbol)}: 所有时间段数据为空")
+    return None
+
+
+def get_sentiment_indicators_batch(symbols: List[str]) -> Dict[str, Optional[Dict]]:
+    """一次请求批量获取多个品种的情绪数据，并写入缓存
+
+    情绪API的 token 字段支持列表，多个品种合并为一次HTTP往返。
+    之后各品种调用 get_sentiment_indicators 时会直接命中缓存。
+    返回条目缺少 token 字段或没有对应条目的品种，单独再请求一次。
+    """
+    results: Dict[str, Optional[Dict]] = {}
+    now_ts = time.time()
+    bucket = int(now_ts // SENTIMENT_BUCKET_SECONDS)
+
+    # 已缓存的品种无需重复请求；按API配置分组（不同配置的品种不能合并）
+    groups: Dict[Tuple[str, str], List[str]] = {}
+    for symbol in symbols:
+        cached = SENTIMENT_CACHE.get((symbol, bucket))
+        if cached is not None and now_ts - cached[0] < SENTIMENT_CACHE_TTL:
+            results[symbol] = cached[1]
+            continue
+        config = SYMBOL_CONFIGS[symbol]
+        groups.setdefault((config.sentiment_api_url, config.sentiment_api_key), []).append(symbol)
+
+    for (api_url, api_key), group_symbols in groups.items():
+        try:
+            tokens = [get_sentiment_token(symbol) for symbol in group_symbols]
+            request_body = build_sentiment_request(api_key, tokens)
+
+            session = get_sentiment_session(group_symbols[0])
+            response = session.post(api_url, data=orjson.dumps(request_body), timeout=(3, 5))
+            if response.status_code != 200:
+                continue
+
+            data = orjson.loads(response.content)
+            if data.get("code") != 200 or not data.get("data"):
+                continue
+
+            # 只按显式的 token 字段拆分返回结果：API 丢弃或调整顺序时，按位置对应会把情绪数据错配到其他品种
+            token_entries = {}
+            for entry in data["data"]:
+                token = entry.get("token")
+                if token:
+                    token_entries[str(token).upper()] = entry
+
+            for symbol, token in zip(group_symbols, tokens):
+                entry = token_entries.get(token)
+                if entry is None:
+                    # 批量结果中没有明确对应的条目，退回单品种请求
+                    results[symbol] = get_sentiment_indicators(symbol)
+                    continue
+                result = parse_sentiment_periods(symbol, entry.get("timePeriods", []))
+                results[symbol] = result
+                if result is not None:
+                    cache_sentiment_result(symbol, bucket, result)
+        except Exception as e:
+            logger.log_error("sentiment_data_batch", f"{[get_base_currency(s) for s in group_symbols]}: {str(e)}")
+
+    return results
+
+
 def get_sentiment_indicators(symbol: str):
     """Get sentiment indicators - simplified version"""
     config = SYMBOL_CONFIGS[symbol]
+
+    # 同一个15分钟桶内的重复请求直接返回缓存
+    now_ts = time.time()
+    bucket = int(now_ts // SENTIMENT_BUCKET_SECONDS)
+    cached = SENTIMENT_CACHE.get((symbol, bucket))
+    if cached is not None and now_ts - cached[0] < SENTIMENT_CACHE_TTL:
+        return cached[1]
+
     try:
         API_URL = config.sentiment_api_url
         API_KEY = config.sentiment_api_key
 
         # 从 symbol 中提取币种名称
         # 格式可能是 "BTC/USDT:USDT" 或 "ETH/USDT:USDT" 等
-        base_currency = symbol.split('/')[0].upper()
-        
-        # Get recent 4-hour data
-        end_time = datetime.now()
-        start_time = end_time - timedelta(hours=4)
-
-        request_body = {
-            "apiKey": API_KEY,
-            "endpoints": ["CO-A-02-01", "CO-A-02-02"],  # Keep only core indicators
-            "startTime": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "endTime": end_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "timeType": "15m",
-            "token": [base_currency]  # 修改这里，使用动态的币种
-        }
+        base_currency = get_sentiment_token(symbol)
 
-        headers = {"Content-Type": "application/json", "X-API-KEY": API_KEY}
-        response = requests.post(API_URL, json=request_body, headers=headers)
+        request_body = build_sentiment_request(API_KEY, [base_currency])  # 使用动态的币种
+
+        session = get_sentiment_session(symbol)
+        # 用 orjson 手动序列化/解析（会话已设置 Content-Type: application/json）
+        response = session.post(API_URL, data=orjson.dumps(request_body), timeout=(3, 5))
 
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             if data.get("code") == 200 and data.get("data"):
                 time_periods = data["data"][0]["timePeriods"]
-
-                # Find first time period with valid data
-                for period in time_periods:
-                    period_data = period.get("data", [])
-
-                    sentiment = {}
-                    valid_data_found = False
-
-                    for item in period_data:
-                        endpoint = item.get("endpoint")
-                        value = item.get("value", "").strip()
-
-                        if value:  # Only process non-empty values
-                            try:
-                                if endpoint in ["CO-A-02-01", "CO-A-02-02"]:
-                                    sentiment[endpoint] = float(value)
-                                    valid_data_found = True
-                            except (ValueError, TypeError):
-                                continue
-
-                    # If valid data found
-                    if valid_data_found and "CO-A-02-01" in sentiment and "CO-A-02-02" in sentiment:
-                        positive = sentiment['CO-A-02-01']
-                        negative = sentiment['CO-A-02-02']
-                        net_sentiment = positive - negative
-
-                        # Correct time delay calculation
-                        data_delay = int((datetime.now() - datetime.strptime(
-                            period['startTime'], '%Y-%m-%d %H:%M:%S')).total_seconds() // 60)
-
-                        logger.log_warning(f"✅ {get_base_currency(symbol)}: 使用情绪数据时间: {period['startTime']} (延迟: {data_delay} 分钟)")
-
-                        return {
-                            'positive_ratio': positive,
-                            'negative_ratio': negative,
-                            'net_sentiment': net_sentiment,
-                            'data_time': period['startTime'],
-                            'data_delay_minutes': data_delay
-                        }
-
-                logger.log_warning(f"❌ {get_base_currency(symbol)}: 所有时间段数据为空")
-                return None
+                result = parse_sentiment_periods(symbol, time_periods)
+                if result is not None:
+                    cache_sentiment_result(symbol, bucket, result)
+                return result
 
         return None
     except Exception as e:
@@ -2297,31 +2506,66 @@ def retry_on_failure(max_retries=None, delay=None, exceptions=(Exception,)):
     return decorator
 
 @retry_on_failure(max_retries=3, delay=2)
-def fetch_ohlcv_with_retry(symbol: str,max_retries=None):
+def fetch_ohlcv_with_retry(symbol: str,max_retries=None, ex=None):
     if max_retries is None:
         max_retries = 3
+    ex = ex or exchange
 
     # 从全局字典中获取该品种的配置
     config = SYMBOL_CONFIGS[symbol]
 
     for i in range(max_retries):
         try:
-            return exchange.fetch_ohlcv(symbol, config.timeframe, limit=config.data_points)
+            return ex.fetch_ohlcv(symbol, config.timeframe, limit=config.data_points)
         except Exception as e:
             logger.log_error(f"Get_kline_{get_base_currency(symbol)} failed, retry {i+1}/{max_retries}", str(e))
             time.sleep(1)
     return None
 
-def fetch_ohlcv(symbol: str):
-    """获取指定交易品种的K线数据 - 改进版"""
+@dataclass
+class KlineFrame:
+    """K线数据的列式存储 (Structure-of-Arrays)，每个字段是一个 numpy 数组"""
+    timestamp: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, count: int = 10) -> 'KlineFrame':
+        """从K线 DataFrame 的最后 count 行构建"""
+        tail = df.tail(count)
+        return cls(
+            timestamp=tail['timestamp'].to_numpy(),
+            open=tail['open'].to_numpy(dtype=np.float64),
+            high=tail['high'].to_numpy(dtype=np.float64),
+            low=tail['low'].to_numpy(dtype=np.float64),
+            close=tail['close'].to_numpy(dtype=np.float64),
+            volume=tail['volume'].to_numpy(dtype=np.float64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """兼容旧格式：转换为字典列表"""
+        return [
+            {'timestamp': ts, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+            for ts, o, h, l, c, v in zip(self.timestamp, self.open, self.high,
+                                         self.low, self.close, self.volume)
+        ]
+
+def fetch_ohlcv(symbol: str, ex=None):
+    """获取指定交易品种的K线数据 - 改进版（ex: 可选的交易所实例，默认使用全局 exchange）"""
     config = SYMBOL_CONFIGS[symbol]
     try:
         # 使用扩展的K线数据
-        df = fetch_extended_ohlcv(symbol, hours=24)
+        df = fetch_extended_ohlcv(symbol, hours=24, ex=ex)
         
         if df is None or len(df) < 50:
             logger.log_warning(f"❌ {get_base_currency(symbol)}: 扩展数据获取失败，使用原方法")
-            ohlcv = fetch_ohlcv_with_retry(symbol)
+            ohlcv = fetch_ohlcv_with_retry(symbol, ex=ex)
             if ohlcv is None:
                 return None, None
             df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
@@ -2347,7 +2591,7 @@ def fetch_ohlcv(symbol: str):
             'volume': current_data['volume'],
             'timeframe': config.timeframe,
             'price_change': ((current_data['close'] - previous_data['close']) / previous_data['close']) * 100,
-            'kline_data': df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(10).to_dict('records'),
+            'kline_data': KlineFrame.from_dataframe(df, 10),
             'technical_data': {
                 'sma_5': current_data.get('sma_5', 0),
                 'sma_20': current_data.get('sma_20', 0),
@@ -2373,6 +2617,27 @@ def fetch_ohlcv(symbol: str):
         logger.log_error(f"fetch_ohlcv_{get_base_currency(symbol)}", str(e))
         return None, None
 
+def prefetch_ohlcv(symbol: str):
+    """后台线程预取K线和指标（使用预取专用交易所实例），返回 (df, price_data, 获取完成时间)"""
+    df, price_data = fetch_ohlcv(symbol, ex=get_prefetch_exchange())
+    return df, price_data, time.monotonic()
+
+def refresh_price_data(symbol: str, price_data: Dict[str, Any]) -> bool:
+    """用最新成交价刷新预取的价格数据（K线指标保持不变），失败返回 False"""
+    try:
+        last = float(exchange.fetch_ticker(symbol)['last'])
+    except Exception as e:
+        logger.log_warning(f"⚠️ {get_base_currency(symbol)}: 刷新最新价格失败: {str(e)}")
+        return False
+    # 由旧价格和涨跌幅反推上一根K线收盘价，重新计算涨跌幅
+    previous_close = price_data['price'] / (1 + price_data['price_change'] / 100)
+    price_data['price'] = last
+    price_data['high'] = max(price_data['high'], last)
+    price_data['low'] = min(price_data['low'], last)
+    price_data['price_change'] = (last - previous_close) / previous_close * 100
+    price_data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return True
+
 def add_to_signal_history(symbol: str, signal_data):
     global signal_history
     
@@ -2402,27 +2667,47 @@ def add_to_price_history(symbol: str, price_data):
         keep_count = int(max_history * 0.8)
         price_history[symbol] = price_history[symbol][-keep_count:]
 
+def safe_float(value, default=0.0):
+    """转换为 float，None/NaN/无法转换时返回默认值（f == f 即非 NaN）"""
+    try:
+        f = float(value)
+        return f if f == f else default
+    except (TypeError, ValueError):
+        return default
+
 def generate_technical_analysis_text(price_data):
     """Generate technical analysis text"""
     if 'technical_data' not in price_data:
         return "Technical indicator data unavailable"
 
-    tech = price_data['technical_data']
+    # Check data validity (每个指标只转换一次)
+    tech = {k: safe_float(v) for k, v in price_data['technical_data'].items()}
     trend = price_data.get('trend_analysis', {})
     levels = price_data.get('levels_analysis', {})
 
-    # Check data validity
-    def safe_float(value, default=0):
-        return float(value) if value and pd.notna(value) else default
-
     analysis_text = f"""
     【技术指标概览】
-    📈 趋势: {trend.get('overall', 'N/A')} | RSI: {safe_float(tech['rsi']):.1f}
+    📈 趋势: {trend.get('overall', 'N/A')} | RSI: {tech.get('rsi', 0):.1f}
     📊 均线: 5期{tech.get('sma_5', 0):.2f} | 20期{tech.get('sma_20', 0):.2f} | 50期{tech.get('sma_50', 0):.2f}
     🎯 关键位: 阻力{levels.get('static_resistance', 0):.2f} | 支撑{levels.get('static_support', 0):.2f}
     """
     return analysis_text
 
+def generate_kline_text(price_data, timeframe: str, count: int = 5) -> str:
+    """Generate recent K-line text (向量化计算涨跌幅和方向)"""
+    klines = price_data['kline_data']
+    opens = klines.open[-count:]
+    closes = klines.close[-count:]
+    changes = (closes - opens) / opens * 100.0
+    trends = np.where(closes > opens, "Bullish", "Bearish")
+
+    lines = [f"【Recent {count} {timeframe} K-line Data】"]
+    lines.extend(
+        f"K-line {i + 1}: {trend} Open:{o:.2f} Close:{c:.2f} Change:{change:+.2f}%"
+        for i, (o, c, change, trend) in enumerate(zip(opens, closes, changes, trends))
+    )
+    return "\n".join(lines) + "\n"
+
 def verify_position_exists(symbol: str, position_info: dict) -> bool:
     """验证持仓是否真实存在 - 增强版本"""
     config = SYMBOL_CONFIGS[symbol]
@@ -2700,73 +2985,38 @@ def set_trailing_stop_order(symbol: str, current_position: dict, stop_price: flo
 def safe_json_parse(json_str):
     """Safely parse JSON, handle non-standard format situations"""
     try:
-        return json.loads(json_str)
-    except json.JSONDecodeError:
+        # 绝大多数回复是合法JSON，直接用 orjson 解析
+        return orjson.loads(json_str)
+    except orjson.JSONDecodeError:
         try:
             # Fix common JSON format issues
-            json_str = json_str.replace("'", '"')
-            json_str = re.sub(r'(\w+):', r'"\1":', json_str)
-            json_str = re.sub(r',\s*}', '}', json_str)
-            json_str = re.sub(r',\s*]', ']', json_str)
+            json_str = json_str.translate(JSON_QUOTE_TABLE)
+            json_str = RE_UNQUOTED_KEY.sub(r'"\1":', json_str)
+            json_str = RE_TRAILING_COMMA.sub(r'\1', json_str)
             # 🆕 修复：移除数字中的逗号（如 106,600 -> 106600）
-            json_str = re.sub(r'(\d),(\d)', r'\1\2', json_str)
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
+            json_str = RE_NUM_COMMA.sub(r'\1\2', json_str)
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError as e:
             logger.log_error("json_parsing", f"Failed to parse: {json_str}")
             logger.log_error("json_parsing", f"Error details: {e}")
             return None
 
 
-def create_fallback_signal(price_data):
-    """Create backup trading signal"""
-    return {
-        "signal": "HOLD",
-        "reason": "Conservative strategy adopted due to temporary unavailability of technical analysis",
-        "stop_loss": price_data['price'] * 0.98,  # -2%
-        "take_profit": price_data['price'] * 1.02,  # +2%
-        "confidence": "LOW",
-        "is_fallback": True
-    }
-
-@retry_on_failure(max_retries=3, delay=2)
-def analyze_with_deepseek(symbol: str, price_data: dict):
-    """Use DeepSeek to analyze market and generate trading signals (enhanced version)"""
-    config = SYMBOL_CONFIGS[symbol]
-    try:
-        # Get the client (will be initialized on the first call)
-        client = get_deepseek_client(symbol)
-    
-        # Generate technical analysis text
-        technical_analysis = generate_technical_analysis_text(price_data)
-
-        # Build K-line data text
-        kline_text = f"【Recent 5 {config.timeframe} K-line Data】\n"
-        for i, kline in enumerate(price_data['kline_data'][-5:]):
-            trend = "Bullish" if kline['close'] > kline['open'] else "Bearish"
-            change = ((kline['close'] - kline['open']) / kline['open']) * 100
-            kline_text += f"K-line {i + 1}: {trend} Open:{kline['open']:.2f} Close:{kline['close']:.2f} Change:{change:+.2f}%\n"
-
-        # Add previous trading signal
-        signal_text = ""
-        if symbol in signal_history and signal_history[symbol]:
-            last_signal = signal_history[symbol][-1]
-            signal_text = f"\n【Previous Trading Signal】\nSignal: {last_signal.get('signal', 'N/A')}\nConfidence: {last_signal.get('confidence', 'N/A')}"
-        # Get sentiment data
-        sentiment_data = get_sentiment_indicators(symbol)
-        # Simplified sentiment text - too much is useless
-        if sentiment_data:
-            sign = '+' if sentiment_data['net_sentiment'] >= 0 else ''
-            sentiment_text = f"【Market Sentiment】Optimistic {sentiment_data['positive_ratio']:.1%} Pessimistic {sentiment_data['negative_ratio']:.1%} Net {sign}{sentiment_data['net_sentiment']:.3f}"
-        else:
-            sentiment_text = "【Market Sentiment】Data temporarily unavailable"
+# DeepSeek 提示词中的静态部分（不随每次调用变化，模块加载时构建一次）
+SYSTEM_MESSAGE_TEMPLATE = """You are a professional trader specializing in {timeframe} period trend analysis and trend reversal detection. 
+                Key Responsibilities:
+                1. Analyze trend strength and identify potential reversal points
+                2. Use multiple confirmation criteria for trend reversals
+                3. Provide clear trading signals based on technical analysis
+                4. Consider existing positions in your analysis
+                5. Strictly follow JSON format requirements
 
-        # Add current position information
-        current_pos = get_current_position(symbol)
-        position_text = "No position" if not current_pos else f"{current_pos['side']} position, Quantity: {current_pos['size']}, P&L: {current_pos['unrealized_pnl']:.2f}USDT"
-        pnl_text = f", Position P&L: {current_pos['unrealized_pnl']:.2f} USDT" if current_pos else ""
+                Trend Reversal Focus:
+                - Pay special attention to breakouts of key support/resistance levels
+                - Look for confirmation from multiple indicators (RSI divergence, MACD cross, volume)
+                - Consider the broader market context in your analysis"""
 
-        # 🆕 Enhanced Trend Reversal Analysis Criteria
-        trend_reversal_criteria = """
+TREND_REVERSAL_CRITERIA_TEMPLATE = """
         【Trend Reversal Judgment Criteria - Must meet at least 2 conditions】
         1. Price breaks through key support/resistance levels + volume amplification
         2. Break of major moving averages (e.g., 20-period, 50-period)  
@@ -2778,35 +3028,14 @@ def analyze_with_deepseek(symbol: str, price_data: dict):
         - Existing position same as current signal → Continue holding, check stop loss
         - Signal is HOLD but position exists → Decide whether to hold based on technical indicators
 
-        【Key Technical Levels for {get_base_currency(symbol)}】
+        【Key Technical Levels for {base_currency}】
         - Strong Resistance: When price approaches recent high + Bollinger Band upper
         - Strong Support: When price approaches recent low + Bollinger Band lower
         - Breakout Confirmation: Requires closing price break + volume > 20-period average
         - False Breakout: Price breaks but fails to sustain, immediately reverses
         """
 
-        prompt = f"""
-        You are a professional cryptocurrency trading analyst. Please analyze based on the following {get_base_currency(symbol)} {config.timeframe} period data:  # 修改这里
-
-        {kline_text}
-
-        {technical_analysis}
-
-        {signal_text}
-
-        {sentiment_text}  # Add sentiment analysis
-
-        【Current Market】
-        - Current price: ${price_data['price']:,.2f}
-        - Time: {price_data['timestamp']}
-        - Current K-line high: ${price_data['high']:,.2f}
-        - Current K-line low: ${price_data['low']:,.2f}
-        - Current K-line volume: {price_data['volume']:.2f} {symbol}
-        - Price change: {price_data['price_change']:+.2f}%
-        - Current position: {position_text}{pnl_text}
-
-        {trend_reversal_criteria}  # 🆕 Add enhanced trend reversal criteria
-
+PROMPT_TRADING_PRINCIPLES = """\
         【Anti-Frequent Trading Important Principles】
         1. **Trend Continuity Priority**: Do not change overall trend judgment based on single K-line or short-term fluctuations
         2. **Position Stability**: Maintain existing position direction unless trend clearly reverses strongly
@@ -2829,13 +3058,9 @@ def analyze_with_deepseek(symbol: str, price_data: dict):
         7. **Technical Indicator Weight**:
         - Trend (moving average arrangement) > RSI > MACD > Bollinger Bands
         - Price breaking key support/resistance levels is important signal
+"""
 
-        【Current Technical Condition Analysis】
-        - Overall trend: {price_data['trend_analysis'].get('overall', 'N/A')}
-        - Short-term trend: {price_data['trend_analysis'].get('short_term', 'N/A')}
-        - RSI status: {price_data['technical_data'].get('rsi', 0):.1f} ({'Overbought' if price_data['technical_data'].get('rsi', 0) > 70 else 'Oversold' if price_data['technical_data'].get('rsi', 0) < 30 else 'Neutral'})
-        - MACD direction: {price_data['trend_analysis'].get('macd', 'N/A')}
-
+PROMPT_POSITION_RULES = """\
         【Intelligent Position Management Rules - Must Follow】
 
         1. **Reduce Over-Conservatism**:
@@ -2863,44 +3088,256 @@ def analyze_with_deepseek(symbol: str, price_data: dict):
         Based on above analysis, please provide clear trading signal
 
         Please reply in following JSON format:
-        {{
+        {
             "signal": "BUY|SELL|HOLD",
             "reason": "Brief analysis reason (including trend judgment and technical basis)",
             "stop_loss": specific price,
             "take_profit": specific price,
             "confidence": "HIGH|MEDIUM|LOW"
-        }}
+        }
         """
 
-        try:
-            response = client.chat.completions.create(
-    model="deepseek-chat",
-    messages=[
-        {"role": "system",
-         "content": f"""You are a professional trader specializing in {config.timeframe} period trend analysis and trend reversal detection. 
-                Key Responsibilities:
-                1. Analyze trend strength and identify potential reversal points
-                2. Use multiple confirmation criteria for trend reversals
-                3. Provide clear trading signals based on technical analysis
-                4. Consider existing positions in your analysis
-                5. Strictly follow JSON format requirements
 
-                Trend Reversal Focus:
-                - Pay special attention to breakouts of key support/resistance levels
-                - Look for confirmation from multiple indicators (RSI divergence, MACD cross, volume)
-                - Consider the broader market context in your analysis"""},
-            {"role": "user", "content": prompt}
-            ],
-                stream=False,
-                temperature=0.1
-            )
+def compact_prompt(text: str) -> str:
+    """去掉每行的缩进空白，减少发送给模型的 token 数"""
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+
+@lru_cache(maxsize=32)
+def get_system_message(timeframe: str, base_currency: str) -> str:
+    """获取系统消息（缓存）
+
+    所有不随行情变化的规则（趋势反转标准、交易原则、仓位管理规则、JSON格式要求）
+    都放在系统消息中，作为每次请求相同的前缀，用户消息只保留实时数据。
+    """
+    return "\n\n".join(compact_prompt(block) for block in (
+        SYSTEM_MESSAGE_TEMPLATE.format(timeframe=timeframe),
+        TREND_REVERSAL_CRITERIA_TEMPLATE.format(base_currency=base_currency),
+        PROMPT_TRADING_PRINCIPLES,
+        PROMPT_POSITION_RULES,
+    ))
+
+
+# DeepSeek 回复的最大token数（JSON回复很短，防止异常情况下无限生成）
+DEEPSEEK_MAX_TOKENS = 1024
+
+
+def stream_deepseek_json(client, messages: List[Dict[str, str]]) -> str:
+    """以流式方式调用DeepSeek，收到完整的 {...} JSON 块后立即中断连接
+
+    通过大括号深度计数判断JSON是否闭合（忽略字符串内部的括号），
+    避免等待模型在JSON之后继续生成的多余文字。
+    """
+    stream = client.chat.completions.create(
+        model="deepseek-chat",
+        messages=messages,
+        stream=True,
+        temperature=0.0,
+        max_tokens=DEEPSEEK_MAX_TOKENS
+    )
+
+    parts = []
+    depth = 0
+    in_string = False
+    escaped = False
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if not content:
+                continue
+            parts.append(content)
+
+            json_closed = False
+            for ch in content:
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif ch == '\\':
+                        escaped = True
+                    elif ch == '"':
+                        in_string = False
+                elif ch == '"':
+                    in_string = depth > 0
+                elif ch == '{':
+                    depth += 1
+                elif ch == '}' and depth > 0:
+                    depth -= 1
+                    if depth == 0:
+                        json_closed = True
+                        break
+            if json_closed:
+                break
+    finally:
+        stream.close()
+
+    return ''.join(parts)
+
+
+def get_llm_cache_key(system_message: str, user_message: str) -> str:
+    """计算提示词哈希（系统消息 + 用户消息）"""
+    return hashlib.blake2b(
+        (system_message + '\x1f' + user_message).encode('utf-8'), digest_size=16
+    ).hexdigest()
+
+
+def get_cached_llm_reply(key: str) -> Optional[str]:
+    """获取未过期的缓存回复"""
+    cached = LLM_REPLY_CACHE.get(key)
+    if cached is None:
+        return None
+    if time.time() - cached[0] >= LLM_REPLY_CACHE_TTL:
+        LLM_REPLY_CACHE.pop(key, None)
+        return None
+    LLM_REPLY_CACHE.move_to_end(key)
+    return cached[1]
+
+
+def cache_llm_reply(key: str, reply: str):
+    """写入回复缓存，超过上限时淘汰最久未使用的条目 (LRU)"""
+    LLM_REPLY_CACHE[key] = (time.time(), reply)
+    LLM_REPLY_CACHE.move_to_end(key)
+    while len(LLM_REPLY_CACHE) > LLM_REPLY_CACHE_MAX_SIZE:
+        LLM_REPLY_CACHE.popitem(last=False)
+
+
+def create_fallback_signal(price_data):
+    """Create backup trading signal"""
+    return {
+        "signal": "HOLD",
+        "reason": "Conservative strategy adopted due to temporary unavailability of technical analysis",
+        "stop_loss": price_data['price'] * 0.98,  # -2%
+        "take_profit": price_data['price'] * 1.02,  # +2%
+        "confidence": "LOW",
+        "is_fallback": True
+    }
+
+def get_signal_cache_key(symbol: str, price_data: dict, position: Optional[dict]) -> Tuple[Any, ...]:
+    """信号缓存键：品种 + 当前K线的开盘时间 + 持仓方向和数量
+
+    提示词包含当前持仓，开平仓后同一根K线内（例如出错后60秒重试）必须重新分析，
+    不能复用基于旧持仓状态得出的信号。
+    """
+    klines = price_data.get('kline_data')
+    if klines is not None and len(klines) > 0:
+        candle = klines.timestamp[-1]
+    else:
+        candle = price_data['timestamp']
+    if position:
+        return (symbol, candle, position['side'], position['size'])
+    return (symbol, candle, None, 0)
+
+
+def cache_signal(key: Tuple[Any, ...], signal_data: Dict):
+    """写入信号缓存，超过上限时淘汰最久未使用的条目 (LRU)"""
+    SIGNAL_CACHE[key] = signal_data
+    SIGNAL_CACHE.move_to_end(key)
+    while len(SIGNAL_CACHE) > SIGNAL_CACHE_MAX_SIZE:
+        SIGNAL_CACHE.popitem(last=False)
+
+
+@retry_on_failure(max_retries=3, delay=2)
+def analyze_with_deepseek(symbol: str, price_data: dict, force_refresh: bool = False):
+    """Use DeepSeek to analyze market and generate trading signals (enhanced version)
+
+    同一根K线内的重复调用直接返回缓存的信号，force_refresh=True 时强制重新分析。
+    """
+    config = SYMBOL_CONFIGS[symbol]
+
+    # 当前持仓既是缓存键的一部分，也用于下面的提示词
+    current_pos = get_current_position(symbol)
+    cache_key = get_signal_cache_key(symbol, price_data, current_pos)
+    if not force_refresh:
+        cached_signal = SIGNAL_CACHE.get(cache_key)
+        if cached_signal is not None:
+            SIGNAL_CACHE.move_to_end(cache_key)
+            logger.log_info(f"♻️ {get_base_currency(symbol)}: 当前K线已有分析结果，复用缓存信号 {cached_signal.get('signal')}")
+            return cached_signal
+
+    try:
+        # Get the client (will be initialized on the first call)
+        client = get_deepseek_client(symbol)
+
+        # 提前在后台获取情绪数据，与下面的提示词构建并发执行
+        sentiment_future = io_executor.submit(get_sentiment_indicators, symbol)
+    
+        # Generate technical analysis text
+        technical_analysis = generate_technical_analysis_text(price_data)
+
+        # Build K-line data text
+        kline_text = generate_kline_text(price_data, config.timeframe)
+
+        # Add previous trading signal
+        signal_text = ""
+        if symbol in signal_history and signal_history[symbol]:
+            last_signal = signal_history[symbol][-1]
+            signal_text = f"\n【Previous Trading Signal】\nSignal: {last_signal.get('signal', 'N/A')}\nConfidence: {last_signal.get('confidence', 'N/A')}"
+        # Get sentiment data (等待后台请求完成)
+        sentiment_data = sentiment_future.result()
+        # Simplified sentiment text - too much is useless
+        if sentiment_data:
+            sign = '+' if sentiment_data['net_sentiment'] >= 0 else ''
+            sentiment_text = f"【Market Sentiment】Optimistic {sentiment_data['positive_ratio']:.1%} Pessimistic {sentiment_data['negative_ratio']:.1%} Net {sign}{sentiment_data['net_sentiment']:.3f}"
+        else:
+            sentiment_text = "【Market Sentiment】Data temporarily unavailable"
+
+        # Add current position information
+        position_text = "No position" if not current_pos else f"{current_pos['side']} position, Quantity: {current_pos['size']}, P&L: {current_pos['unrealized_pnl']:.2f}USDT"
+        pnl_text = f", Position P&L: {current_pos['unrealized_pnl']:.2f} USDT" if current_pos else ""
+
+        base_currency = get_base_currency(symbol)
+
+        # 用户消息只包含实时数据，静态规则全部在系统消息中（见 get_system_message）
+        rsi = price_data['technical_data'].get('rsi', 0)
+        rsi_state = 'Overbought' if rsi > 70 else 'Oversold' if rsi < 30 else 'Neutral'
+        prompt = compact_prompt(f"""
+        Please analyze based on the following {base_currency} {config.timeframe} period data:
+
+        {kline_text}
+        {technical_analysis}
+        {signal_text}
+        {sentiment_text}
+
+        【Current Market】
+        - Current price: ${price_data['price']:,.2f}
+        - Time: {price_data['timestamp']}
+        - Current K-line high: ${price_data['high']:,.2f}
+        - Current K-line low: ${price_data['low']:,.2f}
+        - Current K-line volume: {price_data['volume']:.2f} {symbol}
+        - Price change: {price_data['price_change']:+.2f}%
+        - Current position: {position_text}{pnl_text}
+
+        【Current Technical Condition Analysis】
+        - Overall trend: {price_data['trend_analysis'].get('overall', 'N/A')}
+        - Short-term trend: {price_data['trend_analysis'].get('short_term', 'N/A')}
+        - RSI status: {rsi:.1f} ({rsi_state})
+        - MACD direction: {price_data['trend_analysis'].get('macd', 'N/A')}
+        """)
+
+        try:
+            system_message = get_system_message(config.timeframe, base_currency)
+            # 哈希时去掉每次都不同的时间戳，否则相同行情的提示词永远不会命中缓存
+            llm_cache_key = get_llm_cache_key(system_message, prompt.replace(str(price_data['timestamp']), ''))
+            result = get_cached_llm_reply(llm_cache_key)
+            if result is not None:
+                logger.log_info(f"♻️ {base_currency}: 提示词与近期请求相同，复用DeepSeek回复")
+            else:
+                result = stream_deepseek_json(client, [
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ])
+                if result:
+                    cache_llm_reply(llm_cache_key, result)
 
             # Safely parse JSON
-            result = response.choices[0].message.content.strip()
+            result = result.strip()
 
             # 关键：清理非法引号（如 20-"period" → 20-period）
-            cleaned_content = re.sub(r'(\d+)-"(\w+)"', r'\1-\2', result)  # 移除数字后的引号
-            cleaned_content = re.sub(r'"(\w+)"-(\d+)', r'\1-\2', cleaned_content)  # 移除数字前的引号（如果有）
+            cleaned_content = result
+            if '-"' in cleaned_content or '"-' in cleaned_content:
+                cleaned_content = RE_QUOTED_AFTER_NUM.sub(r'\1-\2', cleaned_content)  # 移除数字后的引号
+                cleaned_content = RE_QUOTED_BEFORE_NUM.sub(r'\1-\2', cleaned_content)  # 移除数字前的引号（如果有）
 
             # Extract JSON part
             start_idx = cleaned_content.find('{')
@@ -2943,6 +3380,10 @@ def analyze_with_deepseek(symbol: str, price_data: dict):
                 if len(set(last_three)) == 1:
                     logger.log_warning(f"⚠️ Note: Consecutive 3 {signal_data['signal']} signals")
 
+            # 备用信号不缓存，下次调用时重新尝试分析
+            if not signal_data.get('is_fallback'):
+                cache_signal(cache_key, signal_data)
+
             return signal_data
 
         except Exception as api_error:
@@ -3891,9 +4332,10 @@ def filter_signal(signal_data, price_data):
 
 
 # 🆕 --- 核心修改：升级主循环以包含持仓管理 ---
-def trading_bot(symbol: str):
+def trading_bot(symbol: str, prefetched_data=None):
     """
     主要交易逻辑循环 - 现在接受 symbol 参数
+    prefetched_data: 可选，后台线程提前提交的 prefetch_ohlcv(symbol) Future
     """
     global CURRENT_SYMBOL
     CURRENT_SYMBOL = symbol  # 设置当前品种，以便日志记录器使用
@@ -3910,8 +4352,21 @@ def trading_bot(symbol: str):
         # 添加执行时间记录
         start_time = time.time()
 
-        # 1. 获取市场和价格数据 (使用 symbol)
-        df, price_data = fetch_ohlcv(symbol)
+        # 1. 获取市场和价格数据 (使用 symbol)，优先使用后台预取的结果
+        df, price_data = None, None
+        if prefetched_data is not None:
+            try:
+                df, price_data, fetched_at = prefetched_data.result()
+                # 预取发生在上一个品种完整执行之前（含 DeepSeek 往返、下单），价格可能已过时：
+                # 超过 PREFETCH_MAX_AGE 时刷新最新价格，刷新失败则完整重新获取
+                if price_data is not None and time.monotonic() - fetched_at > PREFETCH_MAX_AGE:
+                    if not refresh_price_data(symbol, price_data):
+                        df, price_data = None, None
+            except Exception as e:
+                logger.log_warning(f"⚠️ {get_base_currency(symbol)}: 预取数据失败，重新获取: {str(e)}")
+                df, price_data = None, None
+        if df is None or price_data is None:
+            df, price_data = fetch_ohlcv(symbol)
 
         if df is None or price_data is None:
             logger.log_warning(f"❌ Could not fetch data for {get_base_currency(symbol)}.")
@@ -4606,30 +5061,41 @@ def main():
             current_time = time.time()
             executed_this_cycle = False
 
-            # 🆕 动态调度：检查每个品种的执行时间
-            for symbol in symbols_to_trade:
+            # 🆕 本轮到期的品种：多个品种同时到期时一次性批量预取情绪数据
+            due_symbols = [sym for sym in symbols_to_trade
+                           if current_time >= symbol_schedules[sym]['next_execution']]
+            if len(due_symbols) > 1:
+                get_sentiment_indicators_batch(due_symbols)
+
+            # 🆕 动态调度：依次执行到期的品种
+            # 当前品种等待 DeepSeek 回复期间，后台线程提前准备下一个品种的K线和指标
+            next_prefetch = None
+            for index, symbol in enumerate(due_symbols):
                 schedule = symbol_schedules[symbol]
-                
-                if current_time >= schedule['next_execution']:
-                    try:
-                        # 执行交易逻辑
-                        trading_bot(symbol)
-                        schedule['execution_count'] += 1
-                        schedule['last_execution'] = current_time
-                        executed_this_cycle = True
-                        
-                        # 计算下一个执行时间
-                        schedule['next_execution'] = calculate_next_execution_time(symbol)
-                        
-                        next_time_str = datetime.fromtimestamp(schedule['next_execution']).strftime('%H:%M:%S')
-                        time_until_str = format_time_until_next_execution(schedule['next_execution'])
-                        
-                        logger.log_info(f"⏰ {get_base_currency(symbol)}: 下次执行 {next_time_str} ({time_until_str})")
-                        
-                    except Exception as e:
-                        logger.log_error(f"scheduled_execution_{get_base_currency(symbol)}", f"调度执行失败: {str(e)}")
-                        # 出错时仍然设置下一个执行时间，避免阻塞
-                        schedule['next_execution'] = current_time + 60  # 1分钟后重试
+                prefetched_data = next_prefetch
+                next_prefetch = None
+                if index + 1 < len(due_symbols):
+                    next_prefetch = io_executor.submit(prefetch_ohlcv, due_symbols[index + 1])
+
+                try:
+                    # 执行交易逻辑
+                    trading_bot(symbol, prefetched_data)
+                    schedule['execution_count'] += 1
+                    schedule['last_execution'] = current_time
+                    executed_this_cycle = True
+                    
+                    # 计算下一个执行时间
+                    schedule['next_execution'] = calculate_next_execution_time(symbol)
+                    
+                    next_time_str = datetime.fromtimestamp(schedule['next_execution']).strftime('%H:%M:%S')
+                    time_until_str = format_time_until_next_execution(schedule['next_execution'])
+                    
+                    logger.log_info(f"⏰ {get_base_currency(symbol)}: 下次执行 {next_time_str} ({time_until_str})")
+                    
+                except Exception as e:
+                    logger.log_error(f"scheduled_execution_{get_base_currency(symbol)}", f"调度执行失败: {str(e)}")
+                    # 出错时仍然设置下一个执行时间，避免阻塞
+                    schedule['next_execution'] = current_time + 60  # 1分钟后重试
 
             # 🆕 定期健康检查
             if current_time - last_health_check >= health_check_interval:
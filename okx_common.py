@@ -0,0 +1,240 @@
+"""
+OKX 测试脚本共用的工具：合约ID转换、持仓查找、WebSocket 推送订阅
+ds_debug.py 和 ds_final_test.py 共用同一份实现
+"""
+import asyncio
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Callable
+
+try:
+    import ccxt.pro as ccxtpro  # WebSocket 推送（ccxt 4.x 自带）
+except ImportError:
+    ccxtpro = None
+
+
+def to_inst_id(symbol: str) -> str:
+    """将CCXT交易对转换为OKX合约ID（例如 'BTC/USDT:USDT' -> 'BTC-USDT-SWAP'）"""
+    if symbol == 'BTC/USDT:USDT':
+        return 'BTC-USDT-SWAP'
+    elif symbol == 'ETH/USDT:USDT':
+        return 'ETH-USDT-SWAP'
+    else:
+        return symbol.replace('/', '-').replace(':USDT', '-SWAP')
+
+
+def find_position(positions, symbol: str, default_leverage: float) -> Optional[Dict[str, Any]]:
+    """在持仓列表中查找指定交易对的有效持仓（不记录日志，供推送线程使用）"""
+    # 先按交易对和合约数过滤，只对命中的持仓做解析
+    for pos in positions:
+        get = pos.get
+        if get('symbol') != symbol:
+            continue
+        contracts = float(get('contracts') or 0)
+        if contracts <= 0:
+            continue
+
+        return {
+            'side': get('side') or 'unknown',
+            'size': contracts,
+            'entry_price': float(get('entryPrice') or 0),
+            'unrealized_pnl': float(get('unrealizedPnl') or 0),
+            'leverage': float(get('leverage') or default_leverage)
+        }
+    return None
+
+
+class ExchangeStream:
+    """
+    WebSocket 订阅 - 在后台线程的事件循环中运行 ccxt.pro 的 watch_orders / watch_ticker / watch_positions，
+    同步代码通过 wait() 等待指定订单的最终状态、通过 last_price() 读取最新价格、
+    通过 wait_position() 等待持仓变化，无需反复 REST 请求
+
+    config: 提供 symbol / leverage（每次使用时读取，修改交易对后新推送按新交易对处理）
+    get_credentials: 返回 {'api_key', 'secret', 'password'} 的函数
+    get_markets: 返回已加载市场信息的函数（None 时 WebSocket 实例自行加载）
+    """
+    FINAL_STATUSES = ('closed', 'canceled')
+    PRICE_MAX_AGE = 5  # 推送价格超过该秒数未更新则视为过期
+    MAX_TRACKED_ORDERS = 500  # 最多保留的已结束订单状态数（止损止盈触发等无人等待的推送也会记录）
+
+    def __init__(self, config, logger, get_credentials: Callable[[], Dict[str, str]],
+                 get_markets: Callable[[], Optional[Dict[str, Any]]] = lambda: None,
+                 watch_ticker: bool = True):
+        self._config = config
+        self._logger = logger
+        self._get_credentials = get_credentials
+        self._get_markets = get_markets
+        self._want_ticker = watch_ticker
+        self._loop = None
+        self._thread = None
+        self._ws_exchange = None
+        self._lock = threading.Lock()
+        self._events: Dict[str, threading.Event] = {}
+        self._statuses: 'OrderedDict[str, str]' = OrderedDict()
+        self._price: Optional[float] = None
+        self._price_time = 0.0
+        self._position_cond = threading.Condition()
+        self._position: Optional[Dict[str, Any]] = None
+        self._position_seen = False  # 是否已收到过目标交易对的持仓推送
+        self.watching_orders = False
+        self.watching_positions = False
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def start(self) -> bool:
+        """启动订阅（ccxt.pro 不可用时返回 False，调用方退回 REST 轮询）"""
+        if self.running:
+            return True
+        if ccxtpro is None:
+            self._logger.info("ℹ️ ccxt.pro 不可用，订单状态和价格使用 REST 查询")
+            return False
+        try:
+            credentials = self._get_credentials()
+            self._ws_exchange = ccxtpro.okx({
+                'options': {'defaultType': 'swap'},
+                'apiKey': credentials['api_key'],
+                'secret': credentials['secret'],
+                'password': credentials['password'],
+            })
+            # 复用 REST 实例已加载的市场信息，避免 WebSocket 实例再拉取一次
+            markets = self._get_markets()
+            if markets:
+                self._ws_exchange.set_markets(markets)
+            has = self._ws_exchange.has
+            watch_orders = bool(has.get('watchOrders'))
+            watch_ticker = self._want_ticker and bool(has.get('watchTicker'))
+            watch_positions = bool(has.get('watchPositions'))
+            if not (watch_orders or watch_ticker or watch_positions):
+                self._logger.info("ℹ️ 交易所不支持 WebSocket 订阅，订单状态和价格使用 REST 查询")
+                self._ws_exchange = None
+                return False
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='exchange_stream', daemon=True)
+            self._thread.start()
+            if watch_orders:
+                self.watching_orders = True
+                asyncio.run_coroutine_threadsafe(self._watch_orders(), self._loop)
+            if watch_ticker:
+                asyncio.run_coroutine_threadsafe(self._watch_ticker(), self._loop)
+            if watch_positions:
+                self.watching_positions = True
+                asyncio.run_coroutine_threadsafe(self._watch_positions(), self._loop)
+            atexit.register(self.stop)
+            self._logger.info(f"✅ WebSocket 订阅已启动 (订单: {'是' if watch_orders else '否'}, "
+                              f"行情: {'是' if watch_ticker else '否'}, 持仓: {'是' if watch_positions else '否'})")
+            return True
+        except Exception as e:
+            self._logger.warning(f"⚠️ WebSocket 订阅启动失败，使用 REST 查询: {str(e)}")
+            self._loop = None
+            self.watching_orders = self.watching_positions = False
+            return False
+
+    async def _watch_ticker(self):
+        while True:
+            try:
+                ticker = await self._ws_exchange.watch_ticker(self._config.symbol)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._logger.warning(f"⚠️ 行情推送异常，1秒后重连: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if ticker.get('last'):
+                self._price = ticker['last']
+                self._price_time = time.monotonic()
+
+    def last_price(self) -> Optional[float]:
+        """最新推送价格，未订阅或已过期时返回 None"""
+        if self._price is None or time.monotonic() - self._price_time > self.PRICE_MAX_AGE:
+            return None
+        return self._price
+
+    async def _watch_orders(self):
+        while True:
+            try:
+                orders = await self._ws_exchange.watch_orders(self._config.symbol)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._logger.warning(f"⚠️ 订单推送异常，1秒后重连: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            for order in orders:
+                status = order.get('status')
+                if status not in self.FINAL_STATUSES:
+                    continue
+                order_id = str(order.get('id'))
+                with self._lock:
+                    self._statuses[order_id] = status
+                    self._statuses.move_to_end(order_id)
+                    event = self._events.setdefault(order_id, threading.Event())
+                    # 淘汰最早的状态及其事件；等待中且未收到推送的订单不在 _statuses 中，不受影响
+                    while len(self._statuses) > self.MAX_TRACKED_ORDERS:
+                        stale_id, _ = self._statuses.popitem(last=False)
+                        self._events.pop(stale_id, None)
+                event.set()
+
+    def wait(self, order_id: str, timeout: float) -> Optional[str]:
+        """等待订单进入最终状态，返回 'closed'/'canceled'，未订阅或超时返回 None"""
+        if not self.watching_orders:
+            return None
+        order_id = str(order_id)
+        with self._lock:
+            event = self._events.setdefault(order_id, threading.Event())
+        if not event.wait(timeout):
+            return None
+        with self._lock:
+            self._events.pop(order_id, None)
+            return self._statuses.pop(order_id, None)
+
+    async def _watch_positions(self):
+        while True:
+            symbol = self._config.symbol
+            try:
+                positions = await self._ws_exchange.watch_positions([symbol])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._logger.warning(f"⚠️ 持仓推送异常，1秒后重连: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            # 推送只包含有变化的持仓，不含目标交易对时不能据此判断持仓状态
+            if not any(p.get('symbol') == symbol for p in positions):
+                continue
+            with self._position_cond:
+                self._position = find_position(positions, symbol, self._config.leverage)
+                self._position_seen = True
+                self._position_cond.notify_all()
+
+    def wait_position(self, predicate, timeout: float) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        等待推送的持仓满足 predicate（参数为持仓信息或 None），
+        返回 (是否满足, 持仓信息)；未订阅或超时返回 (False, None)
+        """
+        if not self.watching_positions:
+            return False, None
+        deadline = time.monotonic() + timeout
+        with self._position_cond:
+            while not (self._position_seen and predicate(self._position)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False, None
+                self._position_cond.wait(remaining)
+            return True, self._position
+
+    def stop(self):
+        """关闭 WebSocket 连接并停止事件循环"""
+        if not self.running:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._ws_exchange.close(), self._loop).result(timeout=5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self.watching_orders = self.watching_positions = False
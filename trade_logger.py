@@ -2,14 +2,14 @@ import logging
 import os
 import sys
 from datetime import datetime
-from cmd_config import CURRENT_ACCOUNT
+from cmd_config import get_current_account
 
 class TradingLogger:
     def __init__(self, log_level=logging.INFO):
             # ❌ 移除旧的 try...except 导入逻辑
             
-            # 🚀 更改点 2: 直接使用导入的 CURRENT_ACCOUNT (它保证已被设置)
-            self.current_account = CURRENT_ACCOUNT
+            # 🚀 更改点 2: 通过 get_current_account() 惰性获取当前账户
+            self.current_account = get_current_account()
             
             # 生成日志文件路径 (使用 self.current_account 来构造路径)
             self.log_file = f'../Output/{self.current_account}/{self.current_account}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'